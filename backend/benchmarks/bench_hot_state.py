@@ -0,0 +1,194 @@
+"""Benchmark hot state read throughput as the number of worker processes grows.
+
+One owner publishes `--keys` user locations; for each process count, that
+many reader processes attach to the shared segment and look up random keys
+for `--duration` seconds while the owner keeps publishing updates:
+
+    python benchmarks/bench_hot_state.py --processes 1,2,4,8 --keys 50000
+
+`--keys` may not exceed the `locations` cap, so every read is a hit; the
+run fails if any read misses. Results are printed as JSON. Run it on an
+otherwise idle multi-core Linux machine; `scaling` is total throughput
+relative to a single reader.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hot_state import (  # noqa: E402
+    NAMESPACES,
+    HotStateOwner,
+    SharedHotState,
+    location_cell,
+)
+
+
+def reader(
+    environment: Dict[str, str],
+    keys: int,
+    duration: float,
+    seed: int,
+    barrier: Any,
+    results: Any,
+) -> None:
+    state = SharedHotState(
+        environment["FITOLA_HOT_STATE_DIR"],
+        environment["FITOLA_HOT_STATE_ADDRESS"],
+        bytes.fromhex(environment["FITOLA_HOT_STATE_AUTHKEY"]),
+    )
+    rng = random.Random(seed)
+    user_ids = [f"user-{rng.randrange(keys)}" for _ in range(4096)]
+    reads = misses = 0
+    barrier.wait()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        for user_id in user_ids[rng.randrange(64) :: 64]:
+            if state.get("locations", user_id) is None:
+                misses += 1
+        reads += 64
+    state.close()
+    results.put({"reads": reads, "misses": misses})
+
+
+def set_location(owner: HotStateOwner, rng: random.Random, user_id: str) -> None:
+    latitude = 18.52 + rng.uniform(-0.5, 0.5)
+    longitude = 73.85 + rng.uniform(-0.5, 0.5)
+    owner.apply(
+        (
+            "set",
+            "locations",
+            user_id,
+            {
+                "latitude": latitude,
+                "longitude": longitude,
+                "status": "available",
+                "updated_at": "2026-01-01T00:00:00Z",
+            },
+            None,
+            ("location_cells", location_cell(latitude, longitude)),
+        )
+    )
+
+
+def run(processes: int, owner: HotStateOwner, args: argparse.Namespace) -> Dict:
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(processes + 1)
+    results = context.Queue()
+    workers = [
+        context.Process(
+            target=reader,
+            args=(
+                owner.worker_environment(),
+                args.keys,
+                args.duration,
+                seed,
+                barrier,
+                results,
+            ),
+        )
+        for seed in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    stop = threading.Event()
+    publishes = 0
+
+    def churn() -> None:
+        # Keep the writer busy so readers run against live publishes.
+        nonlocal publishes
+        rng = random.Random(processes)
+        while not stop.is_set():
+            for _ in range(args.writes_per_publish):
+                set_location(owner, rng, f"user-{rng.randrange(args.keys)}")
+            owner.publish()
+            publishes += 1
+            stop.wait(args.publish_interval)
+
+    writer = threading.Thread(target=churn)
+    barrier.wait()
+    writer.start()
+    started = time.perf_counter()
+    counts = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - started
+    stop.set()
+    writer.join()
+    for worker in workers:
+        worker.join()
+
+    reads = sum(count["reads"] for count in counts)
+    return {
+        "processes": processes,
+        "reads": reads,
+        "misses": sum(count["misses"] for count in counts),
+        "reads_per_second": round(reads / elapsed, 1),
+        "reads_per_second_per_process": round(reads / elapsed / processes, 1),
+        "publishes": publishes,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", default=None, help="e.g. 1,2,4,8")
+    max_keys = NAMESPACES["locations"].max_entries
+    parser.add_argument("--keys", type=int, default=max_keys)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--segment-mb", type=int, default=64)
+    parser.add_argument("--writes-per-publish", type=int, default=100)
+    parser.add_argument("--publish-interval", type=float, default=0.1)
+    args = parser.parse_args()
+    if not 1 <= args.keys <= max_keys:
+        parser.error(f"--keys must be between 1 and the locations cap ({max_keys}).")
+
+    cpus = os.cpu_count() or 1
+    if args.processes:
+        counts = [int(value) for value in args.processes.split(",")]
+    else:
+        counts = [1]
+        while counts[-1] * 2 <= cpus:
+            counts.append(counts[-1] * 2)
+
+    # The benchmark drives publishing itself, so the owner's timer is idle.
+    owner = HotStateOwner(segment_size=args.segment_mb * 2**20, publish_interval=3600)
+    try:
+        rng = random.Random(0)
+        started = time.perf_counter()
+        for index in range(args.keys):
+            set_location(owner, rng, f"user-{index}")
+        owner.publish()
+        initial_publish = time.perf_counter() - started
+
+        runs: List[Dict[str, Any]] = [run(count, owner, args) for count in counts]
+    finally:
+        owner.close()
+
+    misses = sum(result["misses"] for result in runs)
+    if misses:
+        raise SystemExit(f"{misses} reads missed; throughput would not measure hits.")
+
+    single = runs[0]["reads_per_second"] / runs[0]["processes"]
+    for result in runs:
+        result["scaling"] = round(result["reads_per_second"] / single, 2)
+    print(
+        json.dumps(
+            {
+                "config": {**vars(args), "processes": counts, "cpu_count": cpus},
+                "initial_publish_seconds": round(initial_publish, 3),
+                "runs": runs,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
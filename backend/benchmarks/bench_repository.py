@@ -0,0 +1,149 @@
+"""Benchmark profile reads/writes through the repository under concurrency.
+
+Compares the batched, cached `UserRepository` with direct per-request
+backend calls against a file-backed SQLite database:
+
+    python benchmarks/bench_repository.py --workers 16 --operations 2000
+
+Results are printed as JSON.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repository import SQLiteBackend, UserRepository  # noqa: E402
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_workers(
+    workers: int,
+    operations: int,
+    users: int,
+    read_ratio: float,
+    read: Callable[[str], Any],
+    write: Callable[[Dict[str, Any]], None],
+) -> Dict[str, Any]:
+    latencies: Dict[str, List[float]] = {"read": [], "write": []}
+    lock = threading.Lock()
+    barrier = threading.Barrier(workers + 1)
+
+    def worker(seed: int) -> None:
+        rng = random.Random(seed)
+        local: Dict[str, List[float]] = {"read": [], "write": []}
+        barrier.wait()
+        for _ in range(operations):
+            user_id = f"user-{rng.randrange(users)}"
+            started = time.perf_counter()
+            if rng.random() < read_ratio:
+                read(user_id)
+                kind = "read"
+            else:
+                write({"id": user_id, "weight": round(rng.uniform(50, 110), 1)})
+                kind = "write"
+            local[kind].append(time.perf_counter() - started)
+        with lock:
+            for kind, samples in local.items():
+                latencies[kind].extend(samples)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(workers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result: Dict[str, Any] = {
+        "elapsed_seconds": round(elapsed, 4),
+        "ops_per_second": round(workers * operations / elapsed, 1),
+    }
+    for kind, samples in latencies.items():
+        result[kind] = {
+            "count": len(samples),
+            "mean_ms": round(statistics.fmean(samples) * 1000, 4) if samples else 0.0,
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 4),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 4),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 4),
+        }
+    return result
+
+
+def seed_profiles(backend: SQLiteBackend, users: int) -> None:
+    backend.insert_profiles(
+        [
+            {
+                "id": f"user-{index}",
+                "email": f"user-{index}@example.com",
+                "name": f"User {index}",
+                "weight": 70.0,
+            }
+            for index in range(users)
+        ]
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--operations", type=int, default=2000, help="per worker")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--read-ratio", type=float, default=0.8)
+    parser.add_argument("--pool-size", type=int, default=4)
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {"config": vars(args)}
+    with tempfile.TemporaryDirectory() as directory:
+        backend = SQLiteBackend(
+            os.path.join(directory, "direct.db"), pool_size=args.pool_size
+        )
+        seed_profiles(backend, args.users)
+        results["direct"] = run_workers(
+            args.workers,
+            args.operations,
+            args.users,
+            args.read_ratio,
+            backend.fetch_profile,
+            lambda row: backend.update_profiles([row]),
+        )
+        backend.close()
+
+        backend = SQLiteBackend(
+            os.path.join(directory, "repository.db"), pool_size=args.pool_size
+        )
+        seed_profiles(backend, args.users)
+        repository = UserRepository(backend)
+        results["repository"] = run_workers(
+            args.workers,
+            args.operations,
+            args.users,
+            args.read_ratio,
+            repository.get_profile,
+            repository.save_profile,
+        )
+        repository.flush()
+        results["repository"]["stats"] = dict(repository.stats)
+        repository.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
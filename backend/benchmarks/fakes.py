@@ -0,0 +1,126 @@
+"""Offline stand-ins for the upstream services used by benchmarks and tests.
+
+`FakeGeminiClient` mimics the slice of `google.genai.Client` the app uses
+(`client.models.generate_content(...).text`) and blocks for a configurable
+latency, like the real synchronous SDK call does. `make_rube_transport`
+returns an `httpx.MockTransport` serving Rube MCP responses with latency
+and optional injected failures.
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+import httpx
+
+FAKE_PLAN = {
+    "workout_plan": [
+        {"day": "Monday", "focus": "Full body", "exercises": ["Squat", "Push-up"]},
+        {"day": "Wednesday", "focus": "Cardio", "exercises": ["Intervals"]},
+    ],
+    "diet_plan": {"calories": 2200, "meals": ["Oats", "Dal and rice", "Salad"]},
+    "rationale": "Balanced strength and cardio for steady progress.",
+}
+
+
+@dataclass
+class LatencyProfile:
+    """Latency in seconds: `base` plus uniform noise of +/- `jitter`."""
+
+    base: float = 0.0
+    jitter: float = 0.0
+    seed: Optional[int] = None
+    _rng: random.Random = field(init=False, repr=False)
+    _lock: threading.Lock = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        if self.jitter <= 0:
+            return max(self.base, 0.0)
+        with self._lock:
+            noise = self._rng.uniform(-self.jitter, self.jitter)
+        return max(self.base + noise, 0.0)
+
+
+@dataclass
+class FakeGeminiResponse:
+    text: str
+
+
+class _FakeModels:
+    def __init__(self, owner: "FakeGeminiClient") -> None:
+        self._owner = owner
+
+    def _reply(self, model: str, contents: str) -> str:
+        with self._owner._lock:
+            self._owner.calls += 1
+        if "JSON" in contents and "workout_plan" in contents:
+            return "```json\n" + json.dumps(FAKE_PLAN, indent=2) + "\n```"
+        return f"Fake Gemini reply ({model})."
+
+    def generate_content(self, model: str, contents: str) -> FakeGeminiResponse:
+        delay = self._owner.latency.sample()
+        if delay:
+            time.sleep(delay)
+        return FakeGeminiResponse(self._reply(model, contents))
+
+    def generate_content_stream(
+        self, model: str, contents: str
+    ) -> Iterator[FakeGeminiResponse]:
+        """Yield the reply in `stream_chunk_size` pieces, spreading the latency."""
+        text = self._reply(model, contents)
+        size = self._owner.stream_chunk_size
+        chunks = [text[start : start + size] for start in range(0, len(text), size)]
+        delay = self._owner.latency.sample() / max(len(chunks), 1)
+        for chunk in chunks:
+            if delay:
+                time.sleep(delay)
+            yield FakeGeminiResponse(chunk)
+
+
+class FakeGeminiClient:
+    def __init__(
+        self, latency: Optional[LatencyProfile] = None, stream_chunk_size: int = 64
+    ) -> None:
+        self.latency = latency or LatencyProfile()
+        self.stream_chunk_size = stream_chunk_size
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.models = _FakeModels(self)
+
+
+def make_rube_transport(
+    latency: Optional[LatencyProfile] = None,
+    failure_rate: float = 0.0,
+    failure_status: int = 503,
+    seed: Optional[int] = None,
+) -> httpx.MockTransport:
+    """Serve Rube MCP JSON, failing `failure_rate` of requests with `failure_status`."""
+    latency = latency or LatencyProfile()
+    rng = random.Random(seed)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        delay = latency.sample()
+        if delay:
+            await asyncio.sleep(delay)
+        if failure_rate and rng.random() < failure_rate:
+            return httpx.Response(failure_status, json={"error": "injected failure"})
+        return httpx.Response(
+            200,
+            json={
+                "recipes": [
+                    {"id": "recipe-1", "title": "Protein oats", "calories": 420},
+                    {"id": "recipe-2", "title": "Paneer salad", "calories": 380},
+                ],
+                "query": dict(request.url.params),
+            },
+        )
+
+    return httpx.MockTransport(handler)
@@ -0,0 +1,502 @@
+"""End-to-end load test of the API against fake upstreams.
+
+Starts the app with a fake Gemini client, a mock Rube MCP transport and a
+map index seeded with `LOAD_TEST_USERS` locations (kept moving by the
+"location" route), drives a weighted mix of routes at fixed concurrency and prints a JSON
+report with RPS and p50/p95/p99 latency per route. Runs fully offline:
+
+    python benchmarks/loadtest.py --concurrency 32 --duration 10 \\
+        --gemini-latency 0.2 --gemini-jitter 0.05 --output current.json
+
+    # Exit non-zero if any route regressed by more than 10%
+    python benchmarks/loadtest.py --baseline baseline.json --threshold 0.1
+
+By default the app is served by uvicorn on a loopback port in a separate
+thread, so the load generator never shares an event loop with the app.
+`--transport asgi` calls the app in-process instead (faster, used by tests).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from benchmarks.bench_repository import percentile  # noqa: E402
+from benchmarks.fakes import (  # noqa: E402
+    FakeGeminiClient,
+    LatencyProfile,
+    make_rube_transport,
+)
+from hot_state import HotState, LocalHotState, location_cell  # noqa: E402
+from rube_client import RubeClient, load_rube_client_config  # noqa: E402
+
+# Users whose locations are seeded into the map index and updated by the
+# "location" route, spread over the same area the "map" route queries.
+LOAD_TEST_USERS = 5000
+MAP_LATITUDES = (18.4, 18.6)
+MAP_LONGITUDES = (73.7, 73.9)
+
+DEFAULT_MIX = {
+    "map": 25,
+    "location": 5,
+    "leaderboard": 25,
+    "chat": 15,
+    "translate": 15,
+    "plans": 5,
+    "recipes": 10,
+}
+
+
+def _map_request(rng: random.Random) -> Tuple[str, str, Dict[str, Any]]:
+    params = {
+        "latitude": round(rng.uniform(*MAP_LATITUDES), 5),
+        "longitude": round(rng.uniform(*MAP_LONGITUDES), 5),
+        "radius": rng.choice([1, 5, 10]),
+    }
+    return "GET", "/api/v1/map/nearby", {"params": params}
+
+
+def _location_request(rng: random.Random) -> Tuple[str, str, Dict[str, Any]]:
+    payload = {
+        "user_id": f"loadtest-user-{rng.randrange(LOAD_TEST_USERS)}",
+        "latitude": round(rng.uniform(*MAP_LATITUDES), 5),
+        "longitude": round(rng.uniform(*MAP_LONGITUDES), 5),
+        "timestamp": "2026-02-01T12:00:00Z",
+        "status": rng.choice(["available", "busy"]),
+    }
+    return "POST", "/api/v1/location/update", {"json": payload}
+
+
+def _leaderboard_request(rng: random.Random) -> Tuple[str, str, Dict[str, Any]]:
+    params = {"limit": rng.choice([10, 50, 100]), "offset": rng.randrange(0, 500, 10)}
+    return "GET", "/api/v1/leaderboard/global", {"params": params}
+
+
+def _chat_request(rng: random.Random) -> Tuple[str, str, Dict[str, Any]]:
+    message = rng.choice(
+        [
+            "How many rest days should I take per week?",
+            "Suggest a 20 minute home workout.",
+            "Is it fine to run every day?",
+        ]
+    )
+    return "POST", "/api/v1/chat", {"json": {"message": message}}
+
+
+def _translate_request(rng: random.Random) -> Tuple[str, str, Dict[str, Any]]:
+    payload = {
+        "text": "Let's meet at the gym at 7am.",
+        "source_language": "en",
+        "target_language": rng.choice(["hi", "mr", "es"]),
+    }
+    return "POST", "/api/v1/translate", {"json": payload}
+
+
+def _plans_request(rng: random.Random) -> Tuple[str, str, Dict[str, Any]]:
+    payload = {
+        "age": rng.randint(18, 60),
+        "height_cm": round(rng.uniform(150, 195), 1),
+        "weight_kg": round(rng.uniform(50, 110), 1),
+        "body_type": rng.choice(["Ectomorph", "Mesomorph", "Endomorph"]),
+        "goal": rng.choice(["Weight Loss", "Muscle Gain", "Endurance"]),
+    }
+    return "POST", "/api/v1/plans/ai", {"json": payload}
+
+
+def _plans_stream_request(rng: random.Random) -> Tuple[str, str, Dict[str, Any]]:
+    method, _, kwargs = _plans_request(rng)
+    return method, "/api/v1/plans/ai/stream", kwargs
+
+
+def _recipes_request(rng: random.Random) -> Tuple[str, str, Dict[str, Any]]:
+    params = {"q": rng.choice(["oats", "paneer", "salad"])}
+    return "GET", "/api/v1/rube/recipe-hub/discover", {"params": params}
+
+
+ROUTES: Dict[str, Callable[[random.Random], Tuple[str, str, Dict[str, Any]]]] = {
+    "map": _map_request,
+    "location": _location_request,
+    "leaderboard": _leaderboard_request,
+    "chat": _chat_request,
+    "translate": _translate_request,
+    "plans": _plans_request,
+    "plans_stream": _plans_stream_request,
+    "recipes": _recipes_request,
+}
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parse `route=weight,...`; routes left out are not exercised."""
+    mix: Dict[str, float] = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(
+                f"Unknown route '{name}' in mix (choose from {', '.join(ROUTES)})."
+            )
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise ValueError(f"Weight for '{name}' must be a number (got '{weight}').")
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("At least one route needs a positive weight.")
+    return mix
+
+
+# =============================================================================
+# App setup
+# =============================================================================
+
+
+def seed_locations(state: HotState, users: int, seed: int = 0) -> None:
+    """File `users` locations in the map index, as location updates would."""
+    rng = random.Random(seed)
+    for index in range(users):
+        latitude = rng.uniform(*MAP_LATITUDES)
+        longitude = rng.uniform(*MAP_LONGITUDES)
+        state.set(
+            "locations",
+            f"loadtest-user-{index}",
+            {
+                "latitude": latitude,
+                "longitude": longitude,
+                "status": rng.choice(["available", "busy"]),
+                "updated_at": "2026-02-01T12:00:00Z",
+            },
+            index=("location_cells", location_cell(latitude, longitude)),
+        )
+
+
+def install_fakes(
+    gemini_latency: LatencyProfile,
+    rube_latency: LatencyProfile,
+    rube_failure_rate: float = 0.0,
+    rate_limits: bool = False,
+    users: int = LOAD_TEST_USERS,
+) -> Callable[[], None]:
+    """Point the app at fake upstreams and a seeded map; returns an undo."""
+    names = [
+        "HOT_STATE",
+        "GEMINI_API_KEY",
+        "client",
+        "RUBE_MCP_VALIDATED_BASE_URL",
+        "RUBE_HTTP_TIMEOUT",
+        "RUBE_HTTP_CLIENT",
+        "RATE_LIMITER",
+        "RATE_LIMITER_INITIALIZED",
+    ]
+    saved = {name: getattr(main, name) for name in names}
+    saved_token = os.environ.get("RUBE_MCP_JWT")
+
+    main.GEMINI_API_KEY = "fake-gemini-key"
+    main.client = FakeGeminiClient(gemini_latency)
+    main.RUBE_MCP_VALIDATED_BASE_URL = "https://rube.test"
+    main.RUBE_HTTP_TIMEOUT = 10.0
+    main.RUBE_HTTP_CLIENT = RubeClient(
+        load_rube_client_config(main.RUBE_HTTP_TIMEOUT),
+        transport=make_rube_transport(rube_latency, failure_rate=rube_failure_rate),
+    )
+    if not rate_limits:
+        main.RATE_LIMITER = None
+        main.RATE_LIMITER_INITIALIZED = True
+    os.environ["RUBE_MCP_JWT"] = "fake-rube-token"
+    main.HOT_STATE = LocalHotState()
+    seed_locations(main.HOT_STATE, users)
+
+    def restore() -> None:
+        for name, value in saved.items():
+            setattr(main, name, value)
+        if saved_token is None:
+            os.environ.pop("RUBE_MCP_JWT", None)
+        else:
+            os.environ["RUBE_MCP_JWT"] = saved_token
+
+    return restore
+
+
+class UvicornThread:
+    """Serve `main.app` on an ephemeral loopback port from a background thread."""
+
+    def __init__(self) -> None:
+        import uvicorn
+
+        config = uvicorn.Config(
+            main.app,
+            host="127.0.0.1",
+            port=0,
+            log_level="warning",
+            lifespan="off",
+        )
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> str:
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("uvicorn failed to start.")
+            time.sleep(0.01)
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+# =============================================================================
+# Load generation
+# =============================================================================
+
+
+@dataclass
+class Sample:
+    route: str
+    status: int
+    latency: float
+
+
+@dataclass
+class LoadResult:
+    elapsed: float
+    samples: List[Sample] = field(default_factory=list)
+
+
+async def drive(
+    http_client: httpx.AsyncClient,
+    concurrency: int,
+    mix: Dict[str, float],
+    duration: Optional[float] = None,
+    requests: Optional[int] = None,
+    seed: int = 0,
+) -> LoadResult:
+    """Run `concurrency` workers until `requests` are sent or `duration` passes."""
+    if duration is None and requests is None:
+        raise ValueError("Either duration or requests must be given.")
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+    samples: List[Sample] = []
+    issued = 0
+    started = time.perf_counter()
+    deadline = started + duration if duration is not None else None
+
+    def take_slot() -> bool:
+        nonlocal issued
+        if requests is not None and issued >= requests:
+            return False
+        if deadline is not None and time.perf_counter() >= deadline:
+            return False
+        issued += 1
+        return True
+
+    async def worker(worker_seed: int) -> None:
+        rng = random.Random(worker_seed)
+        while take_slot():
+            route = rng.choices(names, weights)[0]
+            method, path, kwargs = ROUTES[route](rng)
+            request_started = time.perf_counter()
+            try:
+                response = await http_client.request(method, path, **kwargs)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            samples.append(Sample(route, status, time.perf_counter() - request_started))
+
+    await asyncio.gather(
+        *(worker(seed * 10_000 + index) for index in range(concurrency))
+    )
+    return LoadResult(time.perf_counter() - started, samples)
+
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict[str, Any]:
+    latencies = [sample.latency for sample in samples]
+    status_codes: Dict[str, int] = {}
+    for sample in samples:
+        key = str(sample.status) if sample.status else "transport_error"
+        status_codes[key] = status_codes.get(key, 0) + 1
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if not 0 < sample.status < 500),
+        "rps": round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "status_codes": status_codes,
+    }
+
+
+def build_report(result: LoadResult, config: Dict[str, Any]) -> Dict[str, Any]:
+    by_route: Dict[str, List[Sample]] = {}
+    for sample in result.samples:
+        by_route.setdefault(sample.route, []).append(sample)
+    return {
+        "config": config,
+        "elapsed_seconds": round(result.elapsed, 3),
+        "summary": summarize(result.samples, result.elapsed),
+        "routes": {
+            route: summarize(samples, result.elapsed)
+            for route, samples in sorted(by_route.items())
+        },
+    }
+
+
+def compare_reports(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1
+) -> Dict[str, Any]:
+    """Compare per-route RPS and p95 against a baseline report.
+
+    A route regresses when its RPS drops, or its p95 latency grows, by more
+    than `threshold` (a fraction of the baseline value).
+    """
+    routes: Dict[str, Any] = {}
+    regressions: List[str] = []
+    current_routes = dict(current["routes"], overall=current["summary"])
+    baseline_routes = dict(baseline["routes"], overall=baseline["summary"])
+    for route, now in current_routes.items():
+        before = baseline_routes.get(route)
+        if before is None:
+            continue
+        rps_change = (
+            (now["rps"] - before["rps"]) / before["rps"] if before["rps"] else 0.0
+        )
+        p95_change = (
+            (now["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+            if before["p95_ms"]
+            else 0.0
+        )
+        regressed = rps_change < -threshold or p95_change > threshold
+        routes[route] = {
+            "baseline_rps": before["rps"],
+            "rps": now["rps"],
+            "rps_change": round(rps_change, 4),
+            "baseline_p95_ms": before["p95_ms"],
+            "p95_ms": now["p95_ms"],
+            "p95_change": round(p95_change, 4),
+            "regressed": regressed,
+        }
+        if regressed:
+            regressions.append(route)
+    return {"threshold": threshold, "routes": routes, "regressions": regressions}
+
+
+async def run_load_test(
+    args: argparse.Namespace, mix: Dict[str, float]
+) -> Dict[str, Any]:
+    restore = install_fakes(
+        LatencyProfile(args.gemini_latency, args.gemini_jitter, args.seed),
+        LatencyProfile(args.rube_latency, args.rube_jitter, args.seed),
+        rube_failure_rate=args.rube_failure_rate,
+        rate_limits=args.rate_limits,
+    )
+    limits = httpx.Limits(
+        max_connections=args.concurrency, max_keepalive_connections=args.concurrency
+    )
+    try:
+        if args.transport == "asgi":
+            server = None
+            http_client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=main.app),
+                base_url="http://loadtest",
+                limits=limits,
+                timeout=60,
+            )
+        else:
+            server = UvicornThread()
+            http_client = httpx.AsyncClient(
+                base_url=server.__enter__(), limits=limits, timeout=60
+            )
+        try:
+            if args.warmup > 0:
+                await drive(http_client, args.concurrency, mix, duration=args.warmup)
+            result = await drive(
+                http_client,
+                args.concurrency,
+                mix,
+                duration=None if args.requests else args.duration,
+                requests=args.requests,
+                seed=args.seed,
+            )
+        finally:
+            await http_client.aclose()
+            if server is not None:
+                server.__exit__(None, None, None)
+        rube_metrics = main.RUBE_HTTP_CLIENT.metrics()
+    finally:
+        await main.RUBE_HTTP_CLIENT.aclose()
+        restore()
+
+    config = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in {"output", "baseline", "threshold"}
+    }
+    config["mix"] = mix
+    report = build_report(result, config)
+    report["rube_client"] = rube_metrics
+    return report
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument(
+        "--requests", type=int, default=None, help="stop after N requests"
+    )
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds")
+    parser.add_argument(
+        "--mix",
+        default=",".join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()),
+        help="route weights, e.g. map=30,chat=10",
+    )
+    parser.add_argument("--gemini-latency", type=float, default=0.2)
+    parser.add_argument("--gemini-jitter", type=float, default=0.05)
+    parser.add_argument("--rube-latency", type=float, default=0.05)
+    parser.add_argument("--rube-jitter", type=float, default=0.01)
+    parser.add_argument("--rube-failure-rate", type=float, default=0.0)
+    parser.add_argument("--transport", choices=["http", "asgi"], default="http")
+    parser.add_argument(
+        "--rate-limits", action="store_true", help="keep the app's rate limiter on"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--baseline", help="compare against a saved report")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    return parser
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    mix = parse_mix(args.mix)
+    report = asyncio.run(run_load_test(args, mix))
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            comparison = compare_reports(
+                json.load(baseline_file), report, args.threshold
+            )
+        report["comparison"] = comparison
+        exit_code = 1 if comparison["regressions"] else 0
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    print(json.dumps(report, indent=2))
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
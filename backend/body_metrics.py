@@ -0,0 +1,217 @@
+"""Vectorised body metrics: BMI, healthy weight range, BMR, TDEE and macros.
+
+Every function works on whole columns at once so a gym cohort of thousands
+of members is computed in a single NumPy pass. The single-user routes call
+the same code with one-element columns, so their results are identical to
+the matching rows of a cohort request.
+
+BMR uses the Mifflin-St Jeor equation:
+    10 * weight_kg + 6.25 * height_cm - 5 * age + s
+with s = +5 for men, -161 for women (the midpoint, -78, when sex is unknown).
+"""
+
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+BMI_THRESHOLDS = np.array([18.5, 25.0, 30.0])
+BMI_CATEGORIES = np.array(["Underweight", "Normal", "Overweight", "Obese"])
+HEALTHY_BMI_MIN = 18.5
+HEALTHY_BMI_MAX = 24.9
+
+SEX_OFFSETS = {"male": 5.0, "m": 5.0, "female": -161.0, "f": -161.0}
+UNKNOWN_SEX_OFFSET = -78.0
+
+ACTIVITY_FACTORS = {
+    "sedentary": 1.2,
+    "light": 1.375,
+    "moderate": 1.55,
+    "active": 1.725,
+    "very_active": 1.9,
+}
+DEFAULT_ACTIVITY_LEVEL = "moderate"
+
+# Representative ages for the app's onboarding age groups, used when only
+# the group is known.
+AGE_GROUP_AGES = {"baby": 3.0, "teenager": 16.0, "adult": 30.0, "elder": 70.0}
+DEFAULT_AGE = 30.0
+
+# goal -> (calorie adjustment as a fraction of TDEE, protein grams per kg)
+GOAL_TARGETS = {
+    "weight_loss": (-0.20, 2.0),
+    "muscle_gain": (0.10, 1.8),
+    "maintenance": (0.0, 1.4),
+}
+GOAL_ALIASES = {
+    "lose_weight": "weight_loss",
+    "fat_loss": "weight_loss",
+    "gain_muscle": "muscle_gain",
+    "build_muscle": "muscle_gain",
+    "bulk": "muscle_gain",
+}
+FAT_CALORIE_SHARE = 0.25
+CALORIES_PER_GRAM = {"protein": 4.0, "carbs": 4.0, "fats": 9.0}
+
+
+def normalize_label(value: Optional[str]) -> str:
+    if value is None:
+        return ""
+    return "_".join(value.strip().lower().replace("-", " ").split())
+
+
+def _lookup(
+    values: Optional[Sequence[Optional[str]]],
+    size: int,
+    table: Mapping[str, float],
+    default: float,
+    name: str,
+    strict: bool = False,
+) -> np.ndarray:
+    """Map a column of labels to numbers, normalising each distinct label once."""
+    if values is None:
+        return np.full(size, default)
+    if len(values) != size:
+        raise ValueError(f"{name} must have {size} entries (got {len(values)}).")
+    labels = np.asarray(["" if value is None else value for value in values], str)
+    uniques, inverse = np.unique(labels, return_inverse=True)
+    mapped = np.empty(len(uniques))
+    for index, label in enumerate(uniques):
+        key = normalize_label(label)
+        if key in table:
+            mapped[index] = table[key]
+        elif key and strict:
+            raise ValueError(
+                f"Unknown {name} '{label}' (expected one of {', '.join(table)})."
+            )
+        else:
+            mapped[index] = default
+    return mapped[inverse.reshape(-1)]
+
+
+def _column(values: Any, size: Optional[int], name: str) -> np.ndarray:
+    column = np.asarray(values, dtype=float).reshape(-1)
+    if size is not None and column.size != size:
+        raise ValueError(f"{name} must have {size} entries (got {column.size}).")
+    return column
+
+
+def _goal_codes(goals: Optional[Sequence[Optional[str]]], size: int) -> np.ndarray:
+    names = list(GOAL_TARGETS)
+    table = {name: float(index) for index, name in enumerate(names)}
+    table.update({alias: table[goal] for alias, goal in GOAL_ALIASES.items()})
+    default = table["maintenance"]
+    return _lookup(goals, size, table, default, "goal").astype(int)
+
+
+def compute_body_metrics(
+    weight_kg: Any,
+    height_cm: Any,
+    age: Any = None,
+    sex: Optional[Sequence[Optional[str]]] = None,
+    activity_level: Optional[Sequence[Optional[str]]] = None,
+    goal: Optional[Sequence[Optional[str]]] = None,
+    age_group: Optional[Sequence[Optional[str]]] = None,
+) -> Dict[str, np.ndarray]:
+    """Compute BMI through macro targets for every row of the given columns.
+
+    Missing ages fall back to the row's age group, then to `DEFAULT_AGE`.
+    Unknown or missing goals are treated as maintenance; an unknown activity
+    level raises `ValueError`, as do measurements for which the equation
+    gives no positive BMR (very small bodies at high ages).
+    """
+    weight = _column(weight_kg, None, "weight_kg")
+    size = weight.size
+    height = _column(height_cm, size, "height_cm")
+    if not (np.isfinite(weight).all() and (weight > 0).all()):
+        raise ValueError("weight_kg must contain positive numbers.")
+    if not (np.isfinite(height).all() and (height > 0).all()):
+        raise ValueError("height_cm must contain positive numbers.")
+
+    group_age = _lookup(age_group, size, AGE_GROUP_AGES, DEFAULT_AGE, "age_group")
+    if age is None:
+        ages = group_age
+    else:
+        ages = _column(
+            [np.nan if value is None else value for value in age], size, "age"
+        )
+        ages = np.where(np.isnan(ages), group_age, ages)
+    if not (np.isfinite(ages).all() and (ages > 0).all()):
+        raise ValueError("age must contain positive numbers.")
+
+    height_m_sq = (height / 100) ** 2
+    bmi = weight / height_m_sq
+    sex_offset = _lookup(sex, size, SEX_OFFSETS, UNKNOWN_SEX_OFFSET, "sex")
+    activity = _lookup(
+        activity_level,
+        size,
+        ACTIVITY_FACTORS,
+        ACTIVITY_FACTORS[DEFAULT_ACTIVITY_LEVEL],
+        "activity_level",
+        strict=True,
+    )
+    bmr = 10 * weight + 6.25 * height - 5 * ages + sex_offset
+    if not (bmr > 0).all():
+        rows = np.flatnonzero(bmr <= 0).tolist()
+        raise ValueError(
+            f"weight_kg, height_cm and age give no positive BMR in rows {rows}."
+        )
+    tdee = bmr * activity
+
+    goal_codes = _goal_codes(goal, size)
+    calorie_adjustment = np.array([target[0] for target in GOAL_TARGETS.values()])
+    protein_per_kg = np.array([target[1] for target in GOAL_TARGETS.values()])
+    target_calories = np.rint(tdee * (1 + calorie_adjustment[goal_codes]))
+    protein_g = weight * protein_per_kg[goal_codes]
+    fats_g = target_calories * FAT_CALORIE_SHARE / CALORIES_PER_GRAM["fats"]
+    carbs_g = np.maximum(
+        target_calories
+        - protein_g * CALORIES_PER_GRAM["protein"]
+        - fats_g * CALORIES_PER_GRAM["fats"],
+        0,
+    ) / (CALORIES_PER_GRAM["carbs"])
+
+    return {
+        "bmi": np.round(bmi, 1),
+        "category": BMI_CATEGORIES[np.searchsorted(BMI_THRESHOLDS, bmi, side="right")],
+        "healthy_min_weight": np.round(HEALTHY_BMI_MIN * height_m_sq, 1),
+        "healthy_max_weight": np.round(HEALTHY_BMI_MAX * height_m_sq, 1),
+        "age": ages,
+        "bmr": np.round(bmr, 1),
+        "tdee": np.round(tdee, 1),
+        "target_calories": target_calories.astype(int),
+        "protein_g": np.round(protein_g, 1),
+        "carbs_g": np.round(carbs_g, 1),
+        "fats_g": np.round(fats_g, 1),
+    }
+
+
+def metrics_to_columns(metrics: Dict[str, np.ndarray]) -> Dict[str, List[Any]]:
+    return {name: values.tolist() for name, values in metrics.items()}
+
+
+def metrics_to_records(metrics: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    columns = metrics_to_columns(metrics)
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+
+def compute_single_body_metrics(
+    weight_kg: float,
+    height_cm: float,
+    age: Optional[float] = None,
+    sex: Optional[str] = None,
+    activity_level: Optional[str] = None,
+    goal: Optional[str] = None,
+    age_group: Optional[str] = None,
+) -> Dict[str, Any]:
+    """One-row `compute_body_metrics`, returned as plain Python values."""
+    metrics = compute_body_metrics(
+        [weight_kg],
+        [height_cm],
+        age=[age],
+        sex=[sex],
+        activity_level=[activity_level],
+        goal=[goal],
+        age_group=[age_group],
+    )
+    return metrics_to_records(metrics)[0]
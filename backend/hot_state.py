@@ -0,0 +1,838 @@
+"""Hot, read-mostly state shared by every API worker.
+
+User locations (plus a grid-cell index over them), leaderboard pages and
+cached AI responses are kept here instead of in per-worker dictionaries.
+
+With a single process (tests, `python main.py`) `LocalHotState` holds the
+data in memory. In multi-worker mode (`serve.py`) one owner process keeps
+the authoritative copy in a `HotStateStore` and publishes each namespace
+as an immutable hash-table snapshot into a memory-mapped file. Workers map
+those files read-only and look keys up in place, so each snapshot exists
+once in memory no matter how many workers read it. Writes from workers are
+sent to the owner over a Unix socket and become visible at the next
+publish (every `publish_interval` seconds). The same connection carries
+request/reply calls to services hosted by the owner (`HotStateOwner
+services`), which `serve.py` uses to share rate-limit buckets.
+
+Segment layout (little endian):
+
+    header   magic u64 | generation u64 | slot_size u64 | seq[0] u64 | seq[1] u64
+    slot 0   n_buckets u32 | n_items u32 | data_len u64 | buckets | data
+    slot 1   same as slot 0
+
+A bucket is hash u64 | offset u32 | length u32; hash 0 marks an empty
+bucket and `TOMBSTONE_HASH` a deleted one (real hashes are odd). The owner
+keeps each namespace encoded (`SnapshotTable`) and patches only the keys
+written since the last publish, so publishing costs a copy of the table
+rather than a rebuild.
+
+The owner writes the inactive slot, then bumps `generation`; the active
+slot is `generation & 1`. Each slot has a sequence counter that is odd
+while the slot is being rewritten, and readers retry if it changed while
+they were reading (a seqlock), so readers never take a lock. This relies
+on the store/load ordering of x86-64 (TSO); weakly ordered CPUs would need
+explicit barriers.
+"""
+
+import hashlib
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import secrets
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = 0x31544F48414C4F46  # "FOLAHOT1"
+HEADER = struct.Struct("<QQQQQ")
+HEADER_SIZE = 64
+GENERATION_OFFSET = 8
+SEQ_OFFSETS = (24, 32)
+SLOT_HEADER = struct.Struct("<IIQ")
+BUCKET = struct.Struct("<QII")
+KEY_LENGTH = struct.Struct("<H")
+TOMBSTONE_HASH = 2
+# Dead record bytes tolerated beyond the live ones before re-encoding.
+COMPACT_SLACK = 1 << 16
+MAX_READ_ATTEMPTS = 1000
+CALL_TIMEOUT = 1.0
+
+# Segment files are sparse, so only pages holding snapshots use memory.
+DEFAULT_SEGMENT_SIZE = 32 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class NamespaceConfig:
+    # Oldest entries are evicted beyond this many (None: never evict).
+    max_entries: Optional[int] = None
+    # Default time-to-live in seconds for new entries (None: no expiry).
+    ttl: Optional[float] = None
+
+
+NAMESPACES: Dict[str, NamespaceConfig] = {
+    # Live locations: a user who stops sending updates drops off the map.
+    "locations": NamespaceConfig(max_entries=50_000, ttl=10 * 60),
+    "location_cells": NamespaceConfig(),
+    "rankings": NamespaceConfig(max_entries=1_000, ttl=60),
+    "ai_cache": NamespaceConfig(max_entries=10_000, ttl=24 * 3600),
+}
+
+# (namespace, key) of a secondary-index set that should contain an entry.
+IndexRef = Tuple[str, str]
+
+
+def hash_key(key: bytes) -> int:
+    """Stable 64-bit hash (never 0, which marks an empty bucket)."""
+    digest = hashlib.blake2b(key, digest_size=8).digest()
+    return int.from_bytes(digest, "little") | 1
+
+
+def encode_value(value: Any, expires_at: Optional[float]) -> bytes:
+    return json.dumps([expires_at or 0, value], separators=(",", ":")).encode()
+
+
+def decode_value(raw: Optional[bytes], now: float) -> Optional[Any]:
+    if raw is None:
+        return None
+    expires_at, value = json.loads(raw)
+    if expires_at and expires_at <= now:
+        return None
+    return value
+
+
+class SnapshotTable:
+    """An open-addressing hash table (load factor <= 0.5), patched in place.
+
+    `put` appends the key's record to the data area and points its bucket
+    at it; `remove` leaves a tombstone. The owner re-encodes the table with
+    `reset` once it has no room to patch or mostly holds dead records.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, bytes]] = None) -> None:
+        self.reset(entries or {})
+
+    def reset(self, entries: Dict[str, bytes]) -> None:
+        """Re-encode the table to hold exactly `entries`."""
+        n_buckets = 8
+        while n_buckets < 2 * len(entries):
+            n_buckets *= 2
+        mask = n_buckets - 1
+        table: List[Optional[Tuple[int, int, int]]] = [None] * n_buckets
+        slots: Dict[str, int] = {}
+        parts: List[bytes] = []
+        offset = 0
+        for key, value in entries.items():
+            key_bytes = key.encode()
+            key_hash = hash_key(key_bytes)
+            length = KEY_LENGTH.size + len(key_bytes) + len(value)
+            parts += (KEY_LENGTH.pack(len(key_bytes)), key_bytes, value)
+            index = key_hash & mask
+            while table[index] is not None:
+                index = (index + 1) & mask
+            table[index] = (key_hash, offset, length)
+            slots[key] = index
+            offset += length
+        empty = bytes(BUCKET.size)
+        self.n_buckets = n_buckets
+        self.buckets = bytearray(
+            b"".join(
+                empty if bucket is None else BUCKET.pack(*bucket) for bucket in table
+            )
+        )
+        self.data = bytearray(b"".join(parts))
+        # Bucket index of every live key.
+        self._slots = slots
+        # Buckets that are live or tombstones.
+        self._used = len(slots)
+        self._live_bytes = offset
+
+    def can_patch(self, new_keys: int) -> bool:
+        """Whether `new_keys` more keys fit without exceeding the load factor."""
+        return 2 * (self._used + new_keys) <= self.n_buckets
+
+    @property
+    def wasteful(self) -> bool:
+        """Whether dead records take up more room than live ones."""
+        return len(self.data) > 2 * self._live_bytes + COMPACT_SLACK
+
+    def _bucket(self, index: int) -> Tuple[int, int, int]:
+        return BUCKET.unpack_from(self.buckets, index * BUCKET.size)
+
+    def put(self, key: str, value: bytes) -> None:
+        index = self._slots.get(key)
+        if index is None:
+            if not self.can_patch(1):
+                raise ValueError("SnapshotTable is full; reset() it with more room.")
+            key_hash = hash_key(key.encode())
+            mask = self.n_buckets - 1
+            index = key_hash & mask
+            while self._bucket(index)[0] not in (0, TOMBSTONE_HASH):
+                index = (index + 1) & mask
+            if self._bucket(index)[0] == 0:
+                self._used += 1
+            self._slots[key] = index
+        else:
+            key_hash, _, old_length = self._bucket(index)
+            self._live_bytes -= old_length
+        key_bytes = key.encode()
+        record = KEY_LENGTH.pack(len(key_bytes)) + key_bytes + value
+        BUCKET.pack_into(
+            self.buckets, index * BUCKET.size, key_hash, len(self.data), len(record)
+        )
+        self.data += record
+        self._live_bytes += len(record)
+
+    def remove(self, key: str) -> None:
+        index = self._slots.pop(key, None)
+        if index is None:
+            return
+        self._live_bytes -= self._bucket(index)[2]
+        BUCKET.pack_into(self.buckets, index * BUCKET.size, TOMBSTONE_HASH, 0, 0)
+
+    def payload(self) -> bytes:
+        header = SLOT_HEADER.pack(self.n_buckets, len(self._slots), len(self.data))
+        return b"".join((header, self.buckets, self.data))
+
+
+def encode_snapshot(entries: Dict[str, bytes]) -> bytes:
+    """Encode `entries` as one snapshot slot."""
+    return SnapshotTable(entries).payload()
+
+
+class SharedSegment:
+    """A memory-mapped file holding two snapshot slots for one namespace."""
+
+    def __init__(self, path: str, size: int = 0, create: bool = False) -> None:
+        self.path = path
+        if create:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+            try:
+                os.ftruncate(fd, size)
+                self._map = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+            slot_size = (size - HEADER_SIZE) // 2
+            HEADER.pack_into(self._map, 0, MAGIC, 0, slot_size, 0, 0)
+        else:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                size = os.fstat(fd).st_size
+                self._map = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+            finally:
+                os.close(fd)
+        magic, _, self.slot_size, _, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a hot state segment.")
+
+    def _u64(self, offset: int) -> int:
+        return struct.unpack_from("<Q", self._map, offset)[0]
+
+    @property
+    def generation(self) -> int:
+        return self._u64(GENERATION_OFFSET)
+
+    def publish(self, payload: bytes) -> None:
+        """Write `payload` to the inactive slot and make it the active one."""
+        if len(payload) > self.slot_size:
+            raise ValueError(
+                f"Snapshot of {len(payload)} bytes exceeds slot size {self.slot_size}."
+            )
+        generation = self.generation
+        slot = (generation + 1) & 1
+        seq_offset = SEQ_OFFSETS[slot]
+        seq = self._u64(seq_offset)
+        struct.pack_into("<Q", self._map, seq_offset, seq + 1)
+        start = HEADER_SIZE + slot * self.slot_size
+        self._map[start : start + len(payload)] = payload
+        struct.pack_into("<Q", self._map, seq_offset, seq + 2)
+        struct.pack_into("<Q", self._map, GENERATION_OFFSET, generation + 1)
+
+    def lookup(self, key: str) -> Optional[bytes]:
+        """Return the raw value stored for `key` in the active snapshot."""
+        key_bytes = key.encode()
+        key_hash = hash_key(key_bytes)
+        for attempt in range(MAX_READ_ATTEMPTS):
+            slot = self.generation & 1
+            seq_offset = SEQ_OFFSETS[slot]
+            seq = self._u64(seq_offset)
+            if seq & 1:
+                time.sleep(0)
+                continue
+            try:
+                value = self._probe(
+                    HEADER_SIZE + slot * self.slot_size, key_bytes, key_hash
+                )
+            except (struct.error, IndexError):
+                # Offsets from a slot rewritten mid-read; same as a mismatch.
+                continue
+            if self._u64(seq_offset) == seq:
+                return value
+        raise RuntimeError(f"Could not read a consistent snapshot from {self.path}.")
+
+    def _probe(self, start: int, key_bytes: bytes, key_hash: int) -> Optional[bytes]:
+        n_buckets, _, data_len = SLOT_HEADER.unpack_from(self._map, start)
+        if n_buckets == 0:
+            return None
+        buckets_start = start + SLOT_HEADER.size
+        data_start = buckets_start + n_buckets * BUCKET.size
+        if data_start + data_len > len(self._map):
+            return None  # Torn header; the sequence check will retry.
+        mask = n_buckets - 1
+        index = key_hash & mask
+        for _ in range(n_buckets):
+            bucket_hash, offset, length = BUCKET.unpack_from(
+                self._map, buckets_start + index * BUCKET.size
+            )
+            if bucket_hash == 0:
+                return None
+            if bucket_hash == key_hash:
+                entry = data_start + offset
+                if entry + length > len(self._map):
+                    return None  # Torn bucket; the sequence check will retry.
+                (key_length,) = KEY_LENGTH.unpack_from(self._map, entry)
+                key_start = entry + KEY_LENGTH.size
+                if self._map[key_start : key_start + key_length] == key_bytes:
+                    return self._map[key_start + key_length : entry + length]
+            index = (index + 1) & mask
+        return None
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class HotStateStore:
+    """Authoritative hot state; operations are applied in arrival order.
+
+    Entries can be filed under a secondary index: `set(..., index=(ns, key))`
+    adds the entry's key to the JSON list stored at `key` in namespace `ns`,
+    and moves it there from its previous index key.
+    """
+
+    def __init__(self, namespaces: Dict[str, NamespaceConfig] = NAMESPACES) -> None:
+        self.namespaces = namespaces
+        self.entries: Dict[str, Dict[str, bytes]] = {name: {} for name in namespaces}
+        self.tables = {name: SnapshotTable() for name in namespaces}
+        self.dirty: Set[str] = set()
+        # Keys written since the namespace's table was last patched.
+        self._changed: Dict[str, Set[str]] = {name: set() for name in namespaces}
+        # Expiry kept beside the encoded values so it is checked without
+        # decoding them; the heap may hold outdated (expires_at, key) pairs.
+        self._expires_at: Dict[str, Dict[str, float]] = {
+            name: {} for name in namespaces
+        }
+        self._expiry_heaps: Dict[str, List[Tuple[float, str]]] = {
+            name: [] for name in namespaces
+        }
+        self._index_of: Dict[Tuple[str, str], IndexRef] = {}
+        self._index_sets: Dict[IndexRef, Set[str]] = {}
+        # Index lists are re-encoded lazily, once per read or publish.
+        self._stale_indexes: Set[IndexRef] = set()
+
+    def apply(self, op: Tuple[Any, ...]) -> None:
+        name = op[0]
+        if name == "set":
+            _, namespace, key, value, ttl, index = op
+            self.set(namespace, key, value, ttl, index)
+        elif name == "delete":
+            _, namespace, key = op
+            self.delete(namespace, key)
+        else:
+            raise ValueError(f"Unknown hot state operation '{name}'.")
+
+    def get(self, namespace: str, key: str, now: Optional[float] = None) -> Any:
+        self._encode_indexes(namespace)
+        raw = self.entries[namespace].get(key)
+        return decode_value(raw, time.time() if now is None else now)
+
+    def set(
+        self,
+        namespace: str,
+        key: str,
+        value: Any,
+        ttl: Optional[float] = None,
+        index: Optional[IndexRef] = None,
+    ) -> None:
+        config = self.namespaces[namespace]
+        ttl = config.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        entries = self.entries[namespace]
+        # Re-insert so dict order doubles as least-recently-written order.
+        entries.pop(key, None)
+        entries[key] = encode_value(value, expires_at)
+        self._touch(namespace, key)
+        if expires_at:
+            self._expires_at[namespace][key] = expires_at
+            heapq.heappush(self._expiry_heaps[namespace], (expires_at, key))
+        else:
+            self._expires_at[namespace].pop(key, None)
+        self._move_index(namespace, key, index)
+        if config.max_entries is not None:
+            while len(entries) > config.max_entries:
+                self.delete(namespace, next(iter(entries)))
+
+    def delete(self, namespace: str, key: str) -> None:
+        if self.entries[namespace].pop(key, None) is not None:
+            self._touch(namespace, key)
+        self._expires_at[namespace].pop(key, None)
+        self._move_index(namespace, key, None)
+
+    def _touch(self, namespace: str, key: str) -> None:
+        self._changed[namespace].add(key)
+        self.dirty.add(namespace)
+
+    def expire(self, namespace: str, now: float) -> int:
+        """Delete the entries of `namespace` that expired by `now`."""
+        heap = self._expiry_heaps[namespace]
+        expires_at = self._expires_at[namespace]
+        expired = 0
+        while heap and heap[0][0] <= now:
+            when, key = heapq.heappop(heap)
+            if expires_at.get(key) == when:
+                self.delete(namespace, key)
+                expired += 1
+        if len(heap) > 2 * len(expires_at) + 1024:
+            heap[:] = [(when, key) for key, when in expires_at.items()]
+            heapq.heapify(heap)
+        return expired
+
+    def _move_index(self, namespace: str, key: str, index: Optional[IndexRef]) -> None:
+        previous = self._index_of.pop((namespace, key), None)
+        if previous == index:
+            if index is not None:
+                self._index_of[(namespace, key)] = index
+            return
+        if previous is not None:
+            members = self._index_sets[previous]
+            members.discard(key)
+            self._write_index(previous, members)
+        if index is not None:
+            members = self._index_sets.setdefault(index, set())
+            members.add(key)
+            self._index_of[(namespace, key)] = index
+            self._write_index(index, members)
+
+    def _write_index(self, index: IndexRef, members: Set[str]) -> None:
+        if not members:
+            del self._index_sets[index]
+        self._stale_indexes.add(index)
+        self.dirty.add(index[0])
+
+    def _encode_indexes(self, namespace: str) -> None:
+        stale = [index for index in self._stale_indexes if index[0] == namespace]
+        for index in stale:
+            self._stale_indexes.discard(index)
+            members = self._index_sets.get(index)
+            if members:
+                encoded = encode_value(sorted(members), None)
+                self.entries[namespace][index[1]] = encoded
+            else:
+                self.entries[namespace].pop(index[1], None)
+            self._changed[namespace].add(index[1])
+
+    def evict_oldest(self, namespace: str) -> int:
+        """Drop the oldest tenth of `namespace` to make room; return how many.
+
+        An index namespace shrinks by evicting the entries filed under it.
+        """
+        sources = {
+            source
+            for (source, _), (index_namespace, _) in self._index_of.items()
+            if index_namespace == namespace
+        }
+        evicted = 0
+        for source in sources or {namespace}:
+            entries = self.entries[source]
+            for key in list(entries)[: max(1, len(entries) // 10)]:
+                self.delete(source, key)
+                evicted += 1
+        return evicted
+
+    def prepare_snapshot(
+        self, namespace: str, compact: bool = False
+    ) -> Optional[Dict[str, bytes]]:
+        """Bring `tables[namespace]` up to date with the writes since last time.
+
+        Changed keys are patched in; when the table needs re-encoding
+        instead, a copy of the entries is returned for the caller to pass to
+        `reset`, which may then run without holding up further writes.
+        """
+        self.expire(namespace, time.time())
+        self._encode_indexes(namespace)
+        entries = self.entries[namespace]
+        table = self.tables[namespace]
+        changed = self._changed[namespace]
+        rebuild = (
+            compact
+            or 2 * len(changed) > len(entries)
+            or not table.can_patch(len(changed))
+        )
+        if not rebuild:
+            for key in changed:
+                raw = entries.get(key)
+                if raw is None:
+                    table.remove(key)
+                else:
+                    table.put(key, raw)
+            rebuild = table.wasteful
+        changed.clear()
+        self.dirty.discard(namespace)
+        return dict(entries) if rebuild else None
+
+    def snapshot(self, namespace: str, compact: bool = False) -> bytes:
+        """Encode `namespace`, patching only the keys changed since last time."""
+        entries = self.prepare_snapshot(namespace, compact)
+        if entries is not None:
+            self.tables[namespace].reset(entries)
+        return self.tables[namespace].payload()
+
+
+# =============================================================================
+# Worker-facing state
+# =============================================================================
+
+
+class HotState:
+    """Read/write access to hot state from a request handler."""
+
+    def get(self, namespace: str, key: str) -> Any:
+        raise NotImplementedError
+
+    def set(
+        self,
+        namespace: str,
+        key: str,
+        value: Any,
+        ttl: Optional[float] = None,
+        index: Optional[IndexRef] = None,
+    ) -> None:
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class LocalHotState(HotState):
+    """Single-process hot state; writes are visible immediately."""
+
+    def __init__(self) -> None:
+        self.store = HotStateStore()
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Any:
+        with self._lock:
+            return self.store.get(namespace, key)
+
+    def set(self, namespace, key, value, ttl=None, index=None) -> None:
+        with self._lock:
+            self.store.expire(namespace, time.time())
+            self.store.set(namespace, key, value, ttl, index)
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self.store.delete(namespace, key)
+
+
+class SharedHotState(HotState):
+    """Worker view: lock-free reads from the owner's segments, writes sent to it."""
+
+    def __init__(self, directory: str, address: str, authkey: bytes) -> None:
+        self.segments = {
+            namespace: SharedSegment(os.path.join(directory, namespace))
+            for namespace in NAMESPACES
+        }
+        self._address = address
+        self._authkey = authkey
+        self._connection: Optional[Connection] = None
+        self._send_lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Any:
+        return decode_value(self.segments[namespace].lookup(key), time.time())
+
+    def _connect(self) -> Connection:
+        if self._connection is None:
+            self._connection = Client(
+                self._address, family="AF_UNIX", authkey=self._authkey
+            )
+        return self._connection
+
+    def call(self, name: str, *args: Any) -> Any:
+        """Run the owner's service `name` and return its result.
+
+        Raises `OSError` when the owner cannot be reached in time.
+        """
+        with self._send_lock:
+            try:
+                connection = self._connect()
+                connection.send(("call", name, args))
+                if not connection.poll(CALL_TIMEOUT):
+                    raise TimeoutError(f"No reply to '{name}' within {CALL_TIMEOUT}s.")
+                status, result = connection.recv()
+            except (OSError, EOFError) as exc:
+                # The reply may still arrive later; never reuse this stream.
+                if self._connection is not None:
+                    self._connection.close()
+                    self._connection = None
+                if isinstance(exc, EOFError):
+                    raise ConnectionError(str(exc)) from exc
+                raise
+        if status != "ok":
+            raise RuntimeError(f"Hot state service '{name}' failed: {result}")
+        return result
+
+    def _send(self, op: Tuple[Any, ...]) -> None:
+        with self._send_lock:
+            try:
+                self._connect().send(op)
+            except (OSError, EOFError) as exc:
+                # Hot state is rebuildable; drop the write rather than fail
+                # the request, and reconnect on the next one.
+                logger.warning("Dropping hot state write (%s): %s", op[0], exc)
+                self._connection = None
+
+    def set(self, namespace, key, value, ttl=None, index=None) -> None:
+        self._send(("set", namespace, key, value, ttl, index))
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._send(("delete", namespace, key))
+
+    def close(self) -> None:
+        with self._send_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+        for segment in self.segments.values():
+            segment.close()
+
+
+class HotStateOwner:
+    """The single writer: applies worker writes and publishes snapshots.
+
+    Create it in the parent process before starting workers and pass
+    `worker_environment()` to them; `create_hot_state_from_env` in each
+    worker then attaches to the segments. `services` maps names to
+    functions workers can run here through `SharedHotState.call`.
+    """
+
+    def __init__(
+        self,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        publish_interval: float = 0.1,
+        directory: Optional[str] = None,
+        services: Optional[Dict[str, Callable[..., Any]]] = None,
+    ) -> None:
+        self.services = dict(services or {})
+        base = directory or ("/dev/shm" if os.path.isdir("/dev/shm") else None)
+        self.directory = tempfile.mkdtemp(prefix="fitola-hot-state-", dir=base)
+        self.publish_interval = publish_interval
+        self.store = HotStateStore()
+        self.segments = {
+            namespace: SharedSegment(
+                os.path.join(self.directory, namespace), segment_size, create=True
+            )
+            for namespace in NAMESPACES
+        }
+        self.address = os.path.join(self.directory, "writer.sock")
+        self.authkey = secrets.token_bytes(16)
+        self._listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        # `_lock` guards the store. `_publish_lock` is held by the one
+        # publisher and guards the store's tables, which are re-encoded and
+        # copied outside `_lock` so workers' writes are not held up.
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._accept_loop, daemon=True),
+            threading.Thread(target=self._publish_loop, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def worker_environment(self) -> Dict[str, str]:
+        return {
+            "FITOLA_HOT_STATE_DIR": self.directory,
+            "FITOLA_HOT_STATE_ADDRESS": self.address,
+            "FITOLA_HOT_STATE_AUTHKEY": self.authkey.hex(),
+        }
+
+    def apply(self, op: Tuple[Any, ...]) -> None:
+        with self._lock:
+            self.store.apply(op)
+
+    def _accept_loop(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                return  # Listener closed.
+            except Exception:
+                logger.exception("Rejected hot state writer connection.")
+                continue
+            if self._stopped.is_set():
+                connection.close()
+                return
+            threading.Thread(
+                target=self._receive_loop, args=(connection,), daemon=True
+            ).start()
+
+    def _receive_loop(self, connection: Connection) -> None:
+        with connection:
+            while True:
+                try:
+                    op = connection.recv()
+                except (EOFError, OSError):
+                    return
+                if op[0] == "call":
+                    try:
+                        connection.send(self._call(op[1], op[2]))
+                    except (EOFError, OSError):
+                        return
+                    continue
+                try:
+                    self.apply(op)
+                except Exception:
+                    logger.exception("Ignoring invalid hot state operation.")
+
+    def _call(self, name: str, args: Tuple[Any, ...]) -> Tuple[str, Any]:
+        service = self.services.get(name)
+        if service is None:
+            return "error", f"unknown service '{name}'"
+        try:
+            return "ok", service(*args)
+        except Exception as exc:
+            logger.exception("Hot state service %s failed.", name)
+            return "error", repr(exc)
+
+    def publish(self) -> None:
+        """Publish every namespace changed since the last publish."""
+        with self._publish_lock:
+            with self._lock:
+                rebuilds = [
+                    (namespace, self.store.prepare_snapshot(namespace))
+                    for namespace in sorted(self.store.dirty)
+                ]
+            for namespace, entries in rebuilds:
+                table = self.store.tables[namespace]
+                if entries is not None:
+                    table.reset(entries)
+                payload = table.payload()
+                if len(payload) > self.segments[namespace].slot_size:
+                    with self._lock:
+                        payload = self._fit(namespace)
+                if payload is not None:
+                    self.segments[namespace].publish(payload)
+
+    def _fit(self, namespace: str) -> Optional[bytes]:
+        """Compact, then evict from, `namespace` until it fits its segment."""
+        segment = self.segments[namespace]
+        payload = self.store.snapshot(namespace, compact=True)
+        while len(payload) > segment.slot_size:
+            evicted = self.store.evict_oldest(namespace)
+            if not evicted:
+                logger.error(
+                    "Hot state namespace %s (%s bytes) cannot fit its segment.",
+                    namespace,
+                    len(payload),
+                )
+                return None
+            logger.warning(
+                "Hot state namespace %s outgrew its segment; evicted %s entries. "
+                "Consider raising FITOLA_HOT_STATE_SEGMENT_MB.",
+                namespace,
+                evicted,
+            )
+            payload = self.store.snapshot(namespace, compact=True)
+        return payload
+
+    def _publish_loop(self) -> None:
+        while not self._stopped.wait(self.publish_interval):
+            try:
+                self.publish()
+            except Exception:
+                logger.exception("Failed to publish hot state.")
+
+    def close(self) -> None:
+        self._stopped.set()
+        # Closing the listener does not interrupt a blocked accept(); connect
+        # once so the accept loop wakes up and sees the stop flag.
+        try:
+            Client(self.address, family="AF_UNIX", authkey=self.authkey).close()
+        except OSError:
+            pass
+        self._listener.close()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        for segment in self.segments.values():
+            segment.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def create_hot_state_from_env() -> HotState:
+    """Attach to the owner's segments when started by serve.py, else go local."""
+    directory = os.getenv("FITOLA_HOT_STATE_DIR")
+    if not directory:
+        return LocalHotState()
+    address = os.getenv("FITOLA_HOT_STATE_ADDRESS")
+    authkey = os.getenv("FITOLA_HOT_STATE_AUTHKEY")
+    if not address or not authkey:
+        raise ValueError(
+            "FITOLA_HOT_STATE_ADDRESS and FITOLA_HOT_STATE_AUTHKEY must be set "
+            "with FITOLA_HOT_STATE_DIR."
+        )
+    return SharedHotState(directory, address, bytes.fromhex(authkey))
+
+
+# =============================================================================
+# Location index
+# =============================================================================
+
+LOCATION_CELL_DEGREES = 0.1
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+
+def location_cell(latitude: float, longitude: float) -> str:
+    return (
+        f"{math.floor(latitude / LOCATION_CELL_DEGREES)}:"
+        f"{math.floor(longitude / LOCATION_CELL_DEGREES)}"
+    )
+
+
+def cells_within(latitude: float, longitude: float, radius_km: float) -> List[str]:
+    """Grid cells overlapping the bounding box of a circle."""
+    lat_delta = radius_km / KM_PER_DEGREE
+    lon_delta = radius_km / (
+        KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01)
+    )
+    lat_cells = range(
+        math.floor((latitude - lat_delta) / LOCATION_CELL_DEGREES),
+        math.floor((latitude + lat_delta) / LOCATION_CELL_DEGREES) + 1,
+    )
+    lon_cells = range(
+        math.floor((longitude - lon_delta) / LOCATION_CELL_DEGREES),
+        math.floor((longitude + lon_delta) / LOCATION_CELL_DEGREES) + 1,
+    )
+    return [f"{lat}:{lon}" for lat in lat_cells for lon in lon_cells]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(d_phi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
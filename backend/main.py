@@ -1,20 +1,55 @@
+import asyncio
+import hashlib
 import json
 import logging
 import os
 import re
+import uuid
 from contextlib import asynccontextmanager
-from typing import Any, Dict, Optional
+from datetime import datetime, timezone
+from typing import Annotated, Any, Callable, Dict, Optional
 from urllib.parse import urlparse
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 from google import genai
 import httpx
 
+from body_metrics import (
+    HEALTHY_BMI_MAX,
+    HEALTHY_BMI_MIN,
+    compute_body_metrics,
+    compute_single_body_metrics,
+    metrics_to_columns,
+    metrics_to_records,
+)
+from hot_state import (
+    HotState,
+    SharedHotState,
+    cells_within,
+    create_hot_state_from_env,
+    haversine_km,
+    location_cell,
+)
+from plan_stream import IncrementalPlanParser, PlanParseResult, parse_plan_text
+from rate_limit import (
+    RateLimiter,
+    RemoteRateLimitBackend,
+    create_rate_limiter_from_env,
+    enforce_rate_limit,
+)
+from repository import (
+    RepositoryFullError,
+    UserRepository,
+    create_repository_from_env,
+)
+from rube_client import CircuitOpenError, RubeClient, load_rube_client_config
+
 load_dotenv()
 logger = logging.getLogger(__name__)
-from typing import List, Optional
+from typing import List, Literal, Optional
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
@@ -45,8 +80,13 @@ GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 client = genai.Client(api_key=GEMINI_API_KEY) if GEMINI_API_KEY else None
 RUBE_MCP_BASE_URL = os.getenv("RUBE_MCP_BASE_URL", "https://rube.app")
 RUBE_MCP_VALIDATED_BASE_URL: Optional[str] = None
-RUBE_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+RUBE_HTTP_CLIENT: Optional[RubeClient] = None
 RUBE_HTTP_TIMEOUT: Optional[float] = None
+USER_REPOSITORY: Optional[UserRepository] = None
+HOT_STATE: Optional[HotState] = None
+RATE_LIMITER: Optional[RateLimiter] = None
+RATE_LIMITER_INITIALIZED = False
+COHORT_METRICS_MAX_USERS = 50_000
 
 
 def parse_rube_timeout() -> float:
@@ -125,15 +165,89 @@ def validate_rube_base_url() -> str:
     return url.rstrip("/")
 
 
-async def get_rube_http_client() -> httpx.AsyncClient:
+async def get_rube_http_client() -> RubeClient:
     global RUBE_HTTP_CLIENT
     if RUBE_HTTP_TIMEOUT is None:
         raise RuntimeError("Rube MCP timeout is not initialized.")
     if RUBE_HTTP_CLIENT is None:
-        RUBE_HTTP_CLIENT = httpx.AsyncClient(timeout=RUBE_HTTP_TIMEOUT)
+        RUBE_HTTP_CLIENT = RubeClient(load_rube_client_config(RUBE_HTTP_TIMEOUT))
     return RUBE_HTTP_CLIENT
 
 
+def get_user_repository() -> UserRepository:
+    global USER_REPOSITORY
+    if USER_REPOSITORY is None:
+        USER_REPOSITORY = create_repository_from_env()
+    return USER_REPOSITORY
+
+
+def queue_repository_write(
+    write: Callable[[Dict[str, Any]], None], row: Dict[str, Any]
+) -> None:
+    try:
+        write(row)
+    except RepositoryFullError as exc:
+        logger.warning("Rejecting write: %s", exc)
+        raise HTTPException(
+            status_code=503,
+            detail="Too many pending writes; try again shortly.",
+            headers={"Retry-After": "1"},
+        )
+
+
+async def close_user_repository() -> None:
+    global USER_REPOSITORY
+    if USER_REPOSITORY is not None:
+        repository, USER_REPOSITORY = USER_REPOSITORY, None
+        await asyncio.to_thread(repository.close)
+
+
+def get_hot_state() -> HotState:
+    global HOT_STATE
+    if HOT_STATE is None:
+        HOT_STATE = create_hot_state_from_env()
+    return HOT_STATE
+
+
+def close_hot_state() -> None:
+    global HOT_STATE
+    if HOT_STATE is not None:
+        state, HOT_STATE = HOT_STATE, None
+        state.close()
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    global RATE_LIMITER, RATE_LIMITER_INITIALIZED
+    if not RATE_LIMITER_INITIALIZED:
+        state = get_hot_state()
+        # Under serve.py the buckets live in the parent process, shared by
+        # every worker.
+        backend = (
+            RemoteRateLimitBackend(state.call)
+            if isinstance(state, SharedHotState)
+            else None
+        )
+        RATE_LIMITER = create_rate_limiter_from_env(backend)
+        RATE_LIMITER_INITIALIZED = True
+    return RATE_LIMITER
+
+
+def rate_limit(route_class: str):
+    """Route dependency charging the caller's `route_class` budget."""
+
+    # A plain `def` so FastAPI runs it in the threadpool: under serve.py the
+    # charge is a round trip to the owner process and must not block the
+    # event loop.
+    def dependency(request: Request, response: Response) -> None:
+        enforce_rate_limit(get_rate_limiter(), route_class, request, response)
+
+    return dependency
+
+
+def utc_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global RUBE_MCP_VALIDATED_BASE_URL, RUBE_HTTP_TIMEOUT
@@ -144,10 +258,27 @@ async def lifespan(app: FastAPI):
     except ValueError as exc:
         logger.error("Rube MCP configuration error: %s", exc)
         raise RuntimeError(f"Rube MCP configuration error: {exc}") from exc
+    try:
+        get_user_repository()
+    except ValueError as exc:
+        logger.error("Database configuration error: %s", exc)
+        raise RuntimeError(f"Database configuration error: {exc}") from exc
+    try:
+        get_hot_state()
+    except (OSError, ValueError) as exc:
+        logger.error("Hot state configuration error: %s", exc)
+        raise RuntimeError(f"Hot state configuration error: {exc}") from exc
+    try:
+        get_rate_limiter()
+    except ValueError as exc:
+        logger.error("Rate limit configuration error: %s", exc)
+        raise RuntimeError(f"Rate limit configuration error: {exc}") from exc
     try:
         yield
     finally:
         await close_rube_http_client()
+        await close_user_repository()
+        close_hot_state()
 
 
 async def close_rube_http_client() -> None:
@@ -163,7 +294,11 @@ app = FastAPI(title="Fitola Backend", version="1.0.0", lifespan=lifespan)
 async def fetch_rube_json(
     url: str, token: str, params: Optional[Dict[str, Any]] = None
 ) -> dict:
-    """Fetch JSON payloads from the Rube MCP API with Bearer auth."""
+    """Fetch JSON payloads from the Rube MCP API with Bearer auth.
+
+    Transient failures are retried by the Rube client; while its circuit
+    breaker is open requests fail fast with 503.
+    """
     try:
         http_client = await get_rube_http_client()
         response = await http_client.get(
@@ -172,6 +307,12 @@ async def fetch_rube_json(
             headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
         )
         response.raise_for_status()
+    except CircuitOpenError as exc:
+        raise HTTPException(
+            status_code=503,
+            detail="Rube MCP is temporarily unavailable.",
+            headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+        )
     except httpx.HTTPStatusError as exc:
         raise HTTPException(
             status_code=exc.response.status_code,
@@ -194,18 +335,17 @@ def get_language_instruction(language: Optional[str]) -> str:
     return f"Respond in {language}."
 
 
-def parse_json_response(text: str) -> Optional[dict]:
-    cleaned = text.strip()
-    if cleaned.startswith("```"):
-        cleaned = re.sub(r"^```(?:json)?\n", "", cleaned)
-        cleaned = re.sub(r"\n```$", "", cleaned)
-    try:
-        return json.loads(cleaned)
-    except json.JSONDecodeError:
+def log_plan_parse_result(result: PlanParseResult, text: str) -> None:
+    if result.plan is None:
+        logger.warning("Failed to parse Gemini JSON response (length=%s).", len(text))
+    elif result.repaired or result.errors:
         logger.warning(
-            "Failed to parse Gemini JSON response (length=%s).", len(cleaned)
+            "Gemini JSON response needed repair or failed validation "
+            "(length=%s, repaired=%s, errors=%s).",
+            len(text),
+            result.repaired,
+            result.errors,
         )
-        return None
 
 
 def sanitize_prompt_value(value: Optional[str], max_length: int = 200) -> str:
@@ -231,6 +371,7 @@ class UserRegister(BaseModel):
 
 
 class UserProfile(BaseModel):
+    id: Optional[str] = None
     name: Optional[str] = None
     weight: Optional[float] = None
     height: Optional[float] = None
@@ -241,9 +382,42 @@ class UserProfile(BaseModel):
     allergies: Optional[List[str]] = None
 
 
+# Body measurement bounds (as on PlanRequest), shared by the body metric routes.
+AgeYears = Annotated[float, Field(ge=1, le=120)]
+HeightCm = Annotated[float, Field(ge=1, le=300)]
+WeightKg = Annotated[float, Field(ge=1, le=500)]
+Label = Annotated[str, Field(max_length=40)]
+
+
 class BMIRequest(BaseModel):
-    weight: float
-    height: float
+    weight: WeightKg
+    height: HeightCm
+
+
+class CohortMember(BaseModel):
+    user_id: Optional[str] = None
+    weight_kg: WeightKg
+    height_cm: HeightCm
+    age: Optional[AgeYears] = None
+    age_group: Optional[Label] = None
+    sex: Optional[Label] = None
+    activity_level: Optional[Label] = None
+    goal: Optional[Label] = None
+
+
+class CohortMetricsRequest(BaseModel):
+    """Cohort input, either as parallel columns or as `users` records."""
+
+    user_ids: Optional[List[Optional[str]]] = None
+    weight_kg: Optional[List[WeightKg]] = None
+    height_cm: Optional[List[HeightCm]] = None
+    age: Optional[List[Optional[AgeYears]]] = None
+    age_group: Optional[List[Optional[Label]]] = None
+    sex: Optional[List[Optional[Label]]] = None
+    activity_level: Optional[List[Optional[Label]]] = None
+    goal: Optional[List[Optional[Label]]] = None
+    users: Optional[List[CohortMember]] = None
+    orient: Literal["columns", "records"] = "columns"
 
 
 class FitnessRequest(BaseModel):
@@ -259,13 +433,16 @@ class FitnessRequest(BaseModel):
 class NutritionRequest(BaseModel):
     user_id: str
     age_group: str
-    weight: float
-    height: float
+    weight: WeightKg
+    height: HeightCm
     body_type: str
     goals: List[str]
     city: str
     allergies: Optional[List[str]] = None
     duration_days: int = 7
+    age: Optional[int] = Field(default=None, ge=1, le=120)
+    sex: Optional[Label] = None
+    activity_level: Optional[Label] = None
 
 
 class TranslateRequest(BaseModel):
@@ -275,9 +452,10 @@ class TranslateRequest(BaseModel):
 
 class LocationUpdate(BaseModel):
     user_id: str
-    latitude: float
-    longitude: float
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
     timestamp: str
+    status: str = "available"
 
 
 class LocationShare(BaseModel):
@@ -317,12 +495,26 @@ async def health_check():
 @app.post("/api/v1/auth/register")
 async def register_user(user: UserRegister):
     """Register a new user in the system."""
+    repository = get_user_repository()
+    if await asyncio.to_thread(repository.get_profile, user.id) is not None:
+        raise HTTPException(status_code=409, detail="User is already registered.")
+    created_at = utc_now_iso()
+    queue_repository_write(
+        repository.save_profile,
+        {
+            "id": user.id,
+            "email": user.email,
+            "name": user.name,
+            "created_at": created_at,
+            "updated_at": created_at,
+        },
+    )
     return {
         "user": {
             "id": user.id,
             "email": user.email,
             "name": user.name,
-            "created_at": "2026-02-01T12:00:00Z",
+            "created_at": created_at,
         },
         "message": "User registered successfully",
     }
@@ -346,22 +538,24 @@ async def login_user(email: EmailStr, password: str):
 @app.get("/api/v1/user/profile/{user_id}")
 async def get_user_profile(user_id: str):
     """Get user profile by ID."""
-    return {
-        "id": user_id,
-        "name": "John Doe",
-        "email": "john@example.com",
-        "age_group": "Adult",
-        "weight": 75.0,
-        "height": 180.0,
-        "body_type": "Mesomorph",
-        "goals": ["Weight Loss", "Muscle Gain"],
-        "city": "New York",
-    }
+    profile = await asyncio.to_thread(get_user_repository().get_profile, user_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="User profile not found.")
+    return profile
 
 
 @app.put("/api/v1/user/profile")
 async def update_user_profile(profile: UserProfile):
-    """Update user profile."""
+    """Update an existing user profile; `None` fields are left unchanged."""
+    if not profile.id:
+        raise HTTPException(status_code=422, detail="Profile `id` is required.")
+    repository = get_user_repository()
+    if await asyncio.to_thread(repository.get_profile, profile.id) is None:
+        raise HTTPException(status_code=404, detail="User profile not found.")
+    queue_repository_write(
+        repository.save_profile,
+        {**profile.dict(exclude_none=True), "updated_at": utc_now_iso()},
+    )
     return {
         "message": "Profile updated successfully",
         "profile": profile.dict(exclude_none=True),
@@ -371,35 +565,76 @@ async def update_user_profile(profile: UserProfile):
 @app.post("/api/v1/user/bmi")
 async def calculate_bmi(request: BMIRequest):
     """Calculate BMI and return category."""
-    bmi = request.weight / ((request.height / 100) ** 2)
-
-    if bmi < 18.5:
-        category = "Underweight"
-    elif bmi < 25.0:
-        category = "Normal"
-    elif bmi < 30.0:
-        category = "Overweight"
-    else:
-        category = "Obese"
+    try:
+        metrics = compute_single_body_metrics(request.weight, request.height)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
 
     return {
-        "bmi": round(bmi, 1),
-        "category": category,
+        "bmi": metrics["bmi"],
+        "category": metrics["category"],
         "healthy_range": {
-            "min": 18.5,
-            "max": 24.9,
-            "min_weight": round(18.5 * ((request.height / 100) ** 2), 1),
-            "max_weight": round(24.9 * ((request.height / 100) ** 2), 1),
+            "min": HEALTHY_BMI_MIN,
+            "max": HEALTHY_BMI_MAX,
+            "min_weight": metrics["healthy_min_weight"],
+            "max_weight": metrics["healthy_max_weight"],
         },
     }
 
 
+@app.post("/api/v1/user/metrics/cohort")
+async def calculate_cohort_metrics(request: CohortMetricsRequest):
+    """Calculate BMI, BMR, TDEE and macro targets for a whole cohort."""
+    if request.users is not None:
+        columns = {
+            name: [getattr(user, name) for user in request.users]
+            for name in CohortMember.__annotations__
+        }
+        columns["user_ids"] = columns.pop("user_id")
+    else:
+        if request.weight_kg is None or request.height_cm is None:
+            raise HTTPException(
+                status_code=422,
+                detail="Provide either `users` or `weight_kg` and `height_cm` columns.",
+            )
+        columns = request.dict(exclude={"users", "orient"})
+
+    size = len(columns["weight_kg"])
+    if size > COHORT_METRICS_MAX_USERS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Cohorts are limited to {COHORT_METRICS_MAX_USERS} users.",
+        )
+    user_ids = columns.pop("user_ids")
+    if user_ids is not None and len(user_ids) != size:
+        raise HTTPException(
+            status_code=422, detail=f"user_ids must have {size} entries."
+        )
+    try:
+        metrics = compute_body_metrics(**columns)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+    if request.orient == "records":
+        results = metrics_to_records(metrics)
+        if user_ids is not None:
+            results = [
+                {"user_id": user_id, **record}
+                for user_id, record in zip(user_ids, results)
+            ]
+    else:
+        results = metrics_to_columns(metrics)
+        if user_ids is not None:
+            results = {"user_ids": user_ids, **results}
+    return {"count": size, "orient": request.orient, "metrics": results}
+
+
 # =============================================================================
 # AI & Chat Endpoints
 # =============================================================================
 
 
-@app.post("/api/v1/chat")
+@app.post("/api/v1/chat", dependencies=[Depends(rate_limit("chat"))])
 async def chat_with_ai(request: ChatRequest):
     """Chat with Gemini AI for fitness advice."""
     try:
@@ -416,7 +651,7 @@ async def chat_with_ai(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/v1/plans/ai/fitness")
+@app.post("/api/v1/plans/ai/fitness", dependencies=[Depends(rate_limit("plans"))])
 async def generate_fitness_plan(request: FitnessRequest):
     """Generate personalized fitness plan using AI."""
     try:
@@ -450,9 +685,21 @@ async def generate_fitness_plan(request: FitnessRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/v1/plans/ai/nutrition")
+@app.post("/api/v1/plans/ai/nutrition", dependencies=[Depends(rate_limit("plans"))])
 async def generate_nutrition_plan(request: NutritionRequest):
     """Generate personalized nutrition plan using AI."""
+    try:
+        metrics = compute_single_body_metrics(
+            request.weight,
+            request.height,
+            age=request.age,
+            sex=request.sex,
+            activity_level=request.activity_level,
+            goal=request.goals[0] if request.goals else None,
+            age_group=request.age_group,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
     try:
         allergies_str = (
             f"Allergies: {', '.join(request.allergies)}" if request.allergies else ""
@@ -465,6 +712,7 @@ async def generate_nutrition_plan(request: NutritionRequest):
         - Body Type: {request.body_type}
         - Goals: {', '.join(request.goals)}
         - City: {request.city} (use local ingredients)
+        - Daily calorie target: {metrics['target_calories']} kcal
         {allergies_str}
         
         Provide meal plans with breakfast, lunch, dinner, and snacks.
@@ -475,17 +723,17 @@ async def generate_nutrition_plan(request: NutritionRequest):
             model="gemini-2.0-flash", contents=prompt
         )
 
-        # Calculate daily calories based on goals
-        bmr = 10 * request.weight + 6.25 * request.height - 5 * 30  # Simplified
-        daily_calories = int(bmr * 1.5)  # Activity factor
-
         return {
             "id": f"nutrition-{request.user_id}",
             "user_id": request.user_id,
             "title": f"{request.duration_days}-Day Nutrition Plan",
             "description": "AI-generated personalized nutrition plan",
-            "daily_calories": daily_calories,
-            "macros": {"protein": 150, "carbs": 200, "fats": 60},
+            "daily_calories": metrics["target_calories"],
+            "macros": {
+                "protein": metrics["protein_g"],
+                "carbs": metrics["carbs_g"],
+                "fats": metrics["fats_g"],
+            },
             "duration_days": request.duration_days,
             "ai_generated": True,
             "plan_details": response.text,
@@ -503,42 +751,29 @@ async def generate_nutrition_plan(request: NutritionRequest):
 @app.post("/api/v1/chat/message")
 async def send_message(message: ChatMessageRequest):
     """Send a chat message."""
-    return {
-        "id": f"msg-{message.sender_id}",
+    row = {
+        "id": str(uuid.uuid4()),
         "sender_id": message.sender_id,
         "receiver_id": message.receiver_id,
         "message": message.message,
         "type": message.type,
-        "timestamp": "2026-02-01T12:00:00Z",
+        "file_url": message.file_url,
+        "timestamp": utc_now_iso(),
         "is_read": False,
     }
+    queue_repository_write(get_user_repository().add_message, row)
+    return row
 
 
 @app.get("/api/v1/chat/conversation/{user_id}/{other_user_id}")
-async def get_conversation(user_id: str, other_user_id: str):
+async def get_conversation(
+    user_id: str, other_user_id: str, limit: int = Query(100, ge=1, le=500)
+):
     """Get conversation between two users."""
-    return {
-        "messages": [
-            {
-                "id": "msg-1",
-                "sender_id": user_id,
-                "receiver_id": other_user_id,
-                "message": "Hello!",
-                "type": "text",
-                "timestamp": "2026-02-01T12:00:00Z",
-                "is_read": True,
-            },
-            {
-                "id": "msg-2",
-                "sender_id": other_user_id,
-                "receiver_id": user_id,
-                "message": "Hi there!",
-                "type": "text",
-                "timestamp": "2026-02-01T12:01:00Z",
-                "is_read": False,
-            },
-        ]
-    }
+    messages = await asyncio.to_thread(
+        get_user_repository().get_conversation, user_id, other_user_id, limit
+    )
+    return {"messages": messages}
 
 
 @app.get("/api/v1/chat/conversations/{user_id}")
@@ -596,47 +831,45 @@ async def accept_chat_request(request_id: str):
 
 @app.get("/api/v1/map/nearby")
 async def get_nearby_fitbuddies(
-    latitude: float = Query(...),
-    longitude: float = Query(...),
-    radius: int = Query(5, description="Radius in kilometers"),
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    radius: int = Query(5, ge=1, le=50, description="Radius in kilometers"),
     status: Optional[str] = Query(None),
 ):
-    """Get nearby FitBuddies."""
-    # Mock data for demonstration
-    users = [
-        {
-            "id": "user-2",
-            "name": "Jane Doe",
-            "gender": "Female",
-            "latitude": latitude + 0.01,
-            "longitude": longitude + 0.01,
-            "distance": 1.2,
-            "status": "available",
-            "photo_url": None,
-            "bio": "Love yoga and running!",
-        },
-        {
-            "id": "user-3",
-            "name": "John Smith",
-            "gender": "Male",
-            "latitude": latitude - 0.02,
-            "longitude": longitude + 0.02,
-            "distance": 2.5,
-            "status": "available",
-            "photo_url": None,
-            "bio": "Gym enthusiast",
-        },
-    ]
-
-    if status:
-        users = [u for u in users if u["status"] == status]
-
+    """Get nearby FitBuddies from the shared location index."""
+    state = get_hot_state()
+    users = []
+    for cell in cells_within(latitude, longitude, radius):
+        for user_id in state.get("location_cells", cell) or []:
+            location = state.get("locations", user_id)
+            if location is None:
+                continue
+            distance = haversine_km(
+                latitude, longitude, location["latitude"], location["longitude"]
+            )
+            if distance > radius:
+                continue
+            if status and location["status"] != status:
+                continue
+            users.append({**location, "id": user_id, "distance": round(distance, 2)})
+    users.sort(key=lambda user: user["distance"])
     return {"users": users, "total": len(users)}
 
 
 @app.post("/api/v1/location/update")
 async def update_location(location: LocationUpdate):
     """Update user location."""
+    get_hot_state().set(
+        "locations",
+        location.user_id,
+        {
+            "latitude": location.latitude,
+            "longitude": location.longitude,
+            "status": location.status,
+            "updated_at": location.timestamp,
+        },
+        index=("location_cells", location_cell(location.latitude, location.longitude)),
+    )
     return {
         "user_id": location.user_id,
         "latitude": location.latitude,
@@ -678,6 +911,11 @@ async def get_global_leaderboard(
     limit: int = Query(100, le=100), offset: int = Query(0)
 ):
     """Get global leaderboard."""
+    state = get_hot_state()
+    page_key = f"global:{limit}:{offset}"
+    page = state.get("rankings", page_key)
+    if page is not None:
+        return page
     leaderboard = [
         {
             "rank": i + 1,
@@ -689,7 +927,9 @@ async def get_global_leaderboard(
         }
         for i in range(limit)
     ]
-    return {"leaderboard": leaderboard, "total": 1000}
+    page = {"leaderboard": leaderboard, "total": 1000}
+    state.set("rankings", page_key, page)
+    return page
 
 
 @app.get("/api/v1/leaderboard/national/{country}")
@@ -731,46 +971,116 @@ async def get_friends_leaderboard(user_id: str):
     return {"leaderboard": leaderboard, "total": 2}
 
 
-@app.post("/api/v1/plans/ai")
+def ndjson_line(**fields: Any) -> str:
+    return json.dumps(fields) + "\n"
+
+
+def build_plan_prompt(request: PlanRequest) -> str:
+    language_note = get_language_instruction(request.language)
+    body_type = sanitize_prompt_value(request.body_type)
+    goal = sanitize_prompt_value(request.goal)
+    preferences = sanitize_prompt_value(request.preferences)
+    # Expected JSON keys: workout_plan, diet_plan, rationale
+    return (
+        "Create a weekly workout plan and diet plan as JSON with keys "
+        "`workout_plan`, `diet_plan`, and `rationale`.\n"
+        f"Age: {request.age}\n"
+        f"Height (cm): {request.height_cm}\n"
+        f"Weight (kg): {request.weight_kg}\n"
+        f"Body Type: {body_type}\n"
+        f"Goal: {goal}\n"
+        f"Duration (weeks): {request.duration_weeks}\n"
+        f"Preferences: {preferences}\n"
+        f"{language_note}"
+    )
+
+
+@app.post("/api/v1/plans/ai", dependencies=[Depends(rate_limit("plans"))])
 async def ai_plans_generate(request: PlanRequest):
     try:
         gemini_client = require_gemini()
-        language_note = get_language_instruction(request.language)
-        body_type = sanitize_prompt_value(request.body_type)
-        goal = sanitize_prompt_value(request.goal)
-        preferences = sanitize_prompt_value(request.preferences)
-        # Expected JSON keys: workout_plan, diet_plan, rationale
-        prompt = (
-            "Create a weekly workout plan and diet plan as JSON with keys "
-            "`workout_plan`, `diet_plan`, and `rationale`.\n"
-            f"Age: {request.age}\n"
-            f"Height (cm): {request.height_cm}\n"
-            f"Weight (kg): {request.weight_kg}\n"
-            f"Body Type: {body_type}\n"
-            f"Goal: {goal}\n"
-            f"Duration (weeks): {request.duration_weeks}\n"
-            f"Preferences: {preferences}\n"
-            f"{language_note}"
-        )
+        prompt = build_plan_prompt(request)
         response = gemini_client.models.generate_content(
             model=GEMINI_MODEL, contents=prompt
         )
-        parsed_plan = parse_json_response(response.text)
+        result = parse_plan_text(response.text)
+        log_plan_parse_result(result, response.text)
         return {
-            "plan_json": parsed_plan,
+            "plan_json": result.plan,
             "plan_text": response.text,
-            "plan_format": "json" if parsed_plan else "text",
+            "plan_format": "json" if result.plan else "text",
+            "plan_repaired": result.repaired,
+            "plan_errors": result.errors,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/v1/translate")
+@app.post("/api/v1/plans/ai/stream", dependencies=[Depends(rate_limit("plans"))])
+async def ai_plans_stream(request: PlanRequest, response: Response):
+    """Stream plan sections as newline-delimited JSON while Gemini generates.
+
+    Emits `{"event": "section", "name": ..., "data": ...}` as soon as each of
+    `workout_plan`, `diet_plan` and `rationale` is complete, then a final
+    `{"event": "complete", ...}` shaped like the `/api/v1/plans/ai` response.
+    """
+    gemini_client = require_gemini()
+    prompt = build_plan_prompt(request)
+
+    def events():
+        parser = IncrementalPlanParser()
+        try:
+            stream = gemini_client.models.generate_content_stream(
+                model=GEMINI_MODEL, contents=prompt
+            )
+            for chunk in stream:
+                for name, value in parser.feed(chunk.text or ""):
+                    yield ndjson_line(event="section", name=name, data=value)
+        except Exception as e:
+            logger.warning("Gemini plan stream failed: %s", e)
+            yield ndjson_line(event="error", detail=str(e))
+        result = parser.finish()
+        log_plan_parse_result(result, parser.text)
+        # Sections that only became available through repair.
+        for name, value in (result.plan or {}).items():
+            if name not in parser.sections:
+                yield ndjson_line(event="section", name=name, data=value)
+        yield ndjson_line(
+            event="complete",
+            plan_json=result.plan,
+            plan_text=parser.text,
+            plan_format="json" if result.plan else "text",
+            plan_repaired=result.repaired,
+            plan_errors=result.errors,
+        )
+
+    # A returned response replaces the injected one, so carry over the
+    # X-RateLimit-* headers the rate_limit dependency set on it.
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        headers=dict(response.headers),
+    )
+
+
+def translation_cache_key(source: str, target: str, text: str) -> str:
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    return f"translate:{source}:{target}:{digest}"
+
+
+@app.post("/api/v1/translate", dependencies=[Depends(rate_limit("translate"))])
 async def translate_text(request: TranslationRequest):
     try:
         gemini_client = require_gemini()
         source_language = sanitize_language_identifier(request.source_language)
         target_language = sanitize_language_identifier(request.target_language)
+        cache_key = translation_cache_key(
+            source_language, target_language, request.text
+        )
+        state = get_hot_state()
+        cached = state.get("ai_cache", cache_key)
+        if cached is not None:
+            return {"translation": cached}
         prompt = (
             "Translate the following text from "
             f"{source_language} to {target_language}. "
@@ -780,6 +1090,8 @@ async def translate_text(request: TranslationRequest):
         response = gemini_client.models.generate_content(
             model=GEMINI_MODEL, contents=prompt
         )
+        if response.text:
+            state.set("ai_cache", cache_key, response.text)
         return {"translation": response.text}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -793,6 +1105,14 @@ async def rube_recipe_discover(request: Request):
     return await fetch_rube_json(url, token, params=params)
 
 
+@app.get("/api/v1/rube/metrics")
+async def rube_client_metrics():
+    """Connection pool, retry and circuit breaker metrics for the Rube client."""
+    if RUBE_HTTP_CLIENT is None:
+        return {"hosts": {}, "circuit_state": None}
+    return RUBE_HTTP_CLIENT.metrics()
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,239 @@
+"""Incremental parsing, repair and validation of Gemini plan JSON.
+
+Gemini is asked for an object with `workout_plan`, `diet_plan` and
+`rationale` keys, but the text often arrives wrapped in Markdown code
+fences, with trailing commas, or cut off mid-value. `IncrementalPlanParser`
+consumes the text chunk by chunk and emits each top-level section as soon
+as its value is complete, so streaming routes can forward sections before
+generation finishes. `finish()` repairs whatever is left (closing open
+strings and brackets, or cutting back to the last complete value) and
+validates the result against `PLAN_SCHEMA`.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# Top-level key -> accepted JSON types.
+PLAN_SCHEMA: Dict[str, Tuple[type, ...]] = {
+    "workout_plan": (list, dict),
+    "diet_plan": (list, dict),
+    "rationale": (str,),
+}
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+@dataclass
+class PlanParseResult:
+    plan: Optional[Dict[str, Any]]
+    errors: List[str] = field(default_factory=list)
+    repaired: bool = False
+
+    @property
+    def valid(self) -> bool:
+        return self.plan is not None and not self.errors
+
+
+def strip_trailing_commas(text: str) -> str:
+    """Remove commas directly before `]` or `}`, ignoring string contents."""
+    output: List[str] = []
+    in_string = escape = False
+    for char in text:
+        if in_string:
+            output.append(char)
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char in "]}":
+            while output and output[-1].isspace():
+                output.pop()
+            if output and output[-1] == ",":
+                output.pop()
+        elif char == '"':
+            in_string = True
+        output.append(char)
+    return "".join(output)
+
+
+def loads_lenient(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(strip_trailing_commas(text))
+
+
+def validate_plan(plan: Any) -> List[str]:
+    """Return schema violations for a parsed plan (empty when valid)."""
+    if not isinstance(plan, dict):
+        return ["Plan must be a JSON object."]
+    errors = []
+    for key, types in PLAN_SCHEMA.items():
+        if key not in plan:
+            errors.append(f"Missing `{key}`.")
+        elif not isinstance(plan[key], types):
+            expected = " or ".join(
+                "array" if kind is list else "object" if kind is dict else "string"
+                for kind in types
+            )
+            errors.append(f"`{key}` must be {expected}.")
+        elif not plan[key]:
+            errors.append(f"`{key}` is empty.")
+    return errors
+
+
+class IncrementalPlanParser:
+    """Scan streamed text for the top-level plan object, one chunk at a time.
+
+    Text before the first `{` (such as a ```json fence) and after the
+    matching `}` is ignored.
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.sections: Dict[str, Any] = {}
+        self.section_errors: Dict[str, str] = {}
+        self._pos = 0
+        self._start: Optional[int] = None
+        self._end: Optional[int] = None
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        # State of the top-level object: key, colon, value, scalar, after_value.
+        self._expect = "key"
+        self._key_start = 0
+        self._key: Optional[str] = None
+        self._value_start = 0
+        # Last offset where everything before it is a complete value, and the
+        # brackets still open there; used to cut back truncated output.
+        self._safe_cut: Optional[Tuple[int, str]] = None
+
+    @property
+    def complete(self) -> bool:
+        return self._end is not None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Add text; return `(key, value)` for sections completed by it."""
+        self.text += chunk
+        emitted: List[Tuple[str, Any]] = []
+        text = self.text
+        while self._pos < len(text) and self._end is None:
+            self._step(text, self._pos, emitted)
+            self._pos += 1
+        return emitted
+
+    def _emit(self, end: int, emitted: List[Tuple[str, Any]]) -> None:
+        key = self._key
+        self._expect = "after_value"
+        if key is None:
+            return
+        raw = self.text[self._value_start : end].strip()
+        try:
+            value = loads_lenient(raw)
+        except json.JSONDecodeError as exc:
+            self.section_errors[key] = f"`{key}` is not valid JSON: {exc.msg}."
+            return
+        self.sections[key] = value
+        emitted.append((key, value))
+
+    def _step(self, text: str, pos: int, emitted: List[Tuple[str, Any]]) -> None:
+        char = text[pos]
+        if self._start is None:
+            if char == "{":
+                self._start = pos
+                self._stack.append("{")
+            return
+
+        depth = len(self._stack)
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if depth == 1 and self._expect == "key":
+                    self._key = text[self._key_start + 1 : pos]
+                    self._expect = "colon"
+                elif depth == 1 and self._expect == "value":
+                    self._emit(pos + 1, emitted)
+                    self._safe_cut = (pos + 1, "".join(self._stack))
+            return
+
+        if depth == 1 and self._expect == "value" and not char.isspace():
+            self._value_start = pos
+            if char not in '{["':
+                self._expect = "scalar"
+
+        if char == '"':
+            self._in_string = True
+            if depth == 1 and self._expect == "key":
+                self._key_start = pos
+        elif char in "{[":
+            self._stack.append(char)
+        elif char in "}]":
+            if self._stack:
+                self._stack.pop()
+            if depth == 2 and self._expect == "value":
+                self._emit(pos + 1, emitted)
+            elif depth == 1:
+                if self._expect == "scalar":
+                    self._emit(pos, emitted)
+                self._end = pos + 1
+            self._safe_cut = (pos + 1, "".join(self._stack))
+        elif char == ",":
+            if depth == 1:
+                if self._expect == "scalar":
+                    self._emit(pos, emitted)
+                self._expect = "key"
+                self._key = None
+            self._safe_cut = (pos, "".join(self._stack))
+        elif char == ":" and depth == 1 and self._expect == "colon":
+            self._expect = "value"
+
+    def _repair(self) -> Optional[Dict[str, Any]]:
+        if self._start is None:
+            return None
+        body = self.text[self._start :]
+        closers = "".join(_CLOSERS[opener] for opener in reversed(self._stack))
+        # First try closing everything where the text stopped.
+        candidate = body + ('"' if self._in_string else "") + closers
+        try:
+            return loads_lenient(candidate)
+        except json.JSONDecodeError:
+            pass
+        # Otherwise drop the incomplete tail after the last complete value.
+        if self._safe_cut is None:
+            return None
+        cut, stack = self._safe_cut
+        candidate = self.text[self._start : cut] + "".join(
+            _CLOSERS[opener] for opener in reversed(stack)
+        )
+        try:
+            return loads_lenient(candidate)
+        except json.JSONDecodeError:
+            return None
+
+    def finish(self) -> PlanParseResult:
+        """Parse (repairing if necessary) and validate everything fed so far."""
+        if self._end is not None:
+            try:
+                plan = loads_lenient(self.text[self._start : self._end])
+                return PlanParseResult(plan, validate_plan(plan))
+            except json.JSONDecodeError:
+                pass
+        plan = self._repair()
+        if not isinstance(plan, dict):
+            return PlanParseResult(None, ["Response did not contain a JSON object."])
+        return PlanParseResult(plan, validate_plan(plan), repaired=True)
+
+
+def parse_plan_text(text: str) -> PlanParseResult:
+    """Parse a complete Gemini response in one go."""
+    parser = IncrementalPlanParser()
+    parser.feed(text)
+    return parser.finish()
@@ -0,0 +1,389 @@
+"""Token-bucket rate limiting for the Gemini-backed routes.
+
+Every request charges two buckets at once: the caller's bucket for the
+route class (chat, plans, translate) and a global Gemini budget shared by
+all callers. Route classes carry a cost so expensive plan generations use
+more of the global budget than a chat turn. Both buckets are charged
+all-or-nothing, so a request rejected by the global budget does not also
+eat into the caller's own allowance.
+
+Bucket state lives behind `RateLimitBackend`. `InMemoryRateLimitBackend`
+keeps it per process. In multi-worker mode (`serve.py`) the buckets live in
+the parent process, exposed by `rate_limit_services`, and each worker uses
+`RemoteRateLimitBackend` to charge them, so limits do not multiply with the
+worker count.
+"""
+
+import ipaddress
+import logging
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from fastapi import HTTPException, Request, Response
+
+logger = logging.getLogger(__name__)
+
+GEMINI_BUDGET_KEY = "gemini:global"
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    capacity: float
+    refill_per_second: float
+    cost: float = 1.0
+
+
+@dataclass(frozen=True)
+class BucketCharge:
+    key: str
+    capacity: float
+    refill_per_second: float
+    cost: float
+
+
+@dataclass(frozen=True)
+class BucketState:
+    allowed: bool
+    limit: float
+    remaining: float
+    # Seconds until the bucket is full again.
+    reset_after: float
+    # Seconds until the requested cost could be paid (0 when allowed).
+    retry_after: float
+
+
+class RateLimitBackend:
+    """Storage for token buckets."""
+
+    def acquire(self, charges: Sequence[BucketCharge], now: float) -> List[BucketState]:
+        """Charge every bucket, or none of them if any lacks tokens."""
+        raise NotImplementedError
+
+    def compact(self, now: float) -> int:
+        """Drop buckets that have refilled completely; return how many."""
+        raise NotImplementedError
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated_at", "capacity", "refill_per_second")
+
+    def __init__(self, capacity: float, refill_per_second: float, now: float) -> None:
+        self.tokens = capacity
+        self.updated_at = now
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+
+    def refill(self, now: float) -> None:
+        elapsed = max(now - self.updated_at, 0.0)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated_at = now
+
+    def seconds_until(self, tokens: float) -> float:
+        missing = tokens - self.tokens
+        if missing <= 0:
+            return 0.0
+        if self.refill_per_second <= 0:
+            return math.inf
+        return missing / self.refill_per_second
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """Per-process bucket store; each check touches only the charged buckets.
+
+    A bucket that has been idle long enough to refill completely is
+    indistinguishable from a fresh one, so `compact` can drop it without
+    changing any decision.
+    """
+
+    def __init__(self) -> None:
+        self._buckets: Dict[str, _Bucket] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, charges: Sequence[BucketCharge], now: float) -> List[BucketState]:
+        with self._lock:
+            buckets = []
+            for charge in charges:
+                bucket = self._buckets.get(charge.key)
+                if bucket is None:
+                    bucket = _Bucket(charge.capacity, charge.refill_per_second, now)
+                    self._buckets[charge.key] = bucket
+                else:
+                    bucket.refill(now)
+                buckets.append(bucket)
+            allowed = all(
+                bucket.tokens >= charge.cost for bucket, charge in zip(buckets, charges)
+            )
+            states = []
+            for bucket, charge in zip(buckets, charges):
+                if allowed:
+                    bucket.tokens -= charge.cost
+                states.append(
+                    BucketState(
+                        allowed=allowed or bucket.tokens >= charge.cost,
+                        limit=bucket.capacity,
+                        remaining=bucket.tokens,
+                        reset_after=bucket.seconds_until(bucket.capacity),
+                        retry_after=(
+                            0.0 if allowed else bucket.seconds_until(charge.cost)
+                        ),
+                    )
+                )
+            return states
+
+    def compact(self, now: float) -> int:
+        with self._lock:
+            idle = [
+                key
+                for key, bucket in self._buckets.items()
+                if bucket.tokens + (now - bucket.updated_at) * bucket.refill_per_second
+                >= bucket.capacity
+            ]
+            for key in idle:
+                del self._buckets[key]
+            return len(idle)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RemoteRateLimitBackend(RateLimitBackend):
+    """Charges buckets held by another process through `call(name, *args)`.
+
+    `call` is `SharedHotState.call`; the owner side is `rate_limit_services`
+    and uses its own clock. `call` raises `OSError` if the owner cannot be
+    reached and `RuntimeError` if the service failed there; either way the
+    request is let through (and logged) rather than failing every Gemini
+    route.
+    """
+
+    def __init__(self, call: Callable[..., Any]) -> None:
+        self._call = call
+
+    def acquire(self, charges: Sequence[BucketCharge], now: float) -> List[BucketState]:
+        try:
+            return self._call("rate_limit.acquire", list(charges))
+        except (OSError, RuntimeError) as exc:
+            logger.warning("Rate limit owner unavailable, allowing request: %s", exc)
+            return [
+                BucketState(True, charge.capacity, charge.capacity, 0.0, 0.0)
+                for charge in charges
+            ]
+
+    def compact(self, now: float) -> int:
+        try:
+            return self._call("rate_limit.compact")
+        except (OSError, RuntimeError):
+            return 0
+
+
+def rate_limit_services(
+    backend: Optional[RateLimitBackend] = None,
+    clock: Callable[[], float] = time.monotonic,
+) -> Dict[str, Callable[..., Any]]:
+    """Owner-side handlers backing `RemoteRateLimitBackend`."""
+    backend = backend or InMemoryRateLimitBackend()
+    return {
+        "rate_limit.acquire": lambda charges: backend.acquire(charges, clock()),
+        "rate_limit.compact": lambda: backend.compact(clock()),
+    }
+
+
+class RateLimiter:
+    """Applies per-caller route-class policies plus the global Gemini budget."""
+
+    def __init__(
+        self,
+        policies: Dict[str, RateLimitPolicy],
+        gemini_budget: Optional[RateLimitPolicy],
+        backend: Optional[RateLimitBackend] = None,
+        compact_interval: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.policies = policies
+        self.gemini_budget = gemini_budget
+        self.backend = backend or InMemoryRateLimitBackend()
+        self.compact_interval = compact_interval
+        self._clock = clock
+        self._next_compaction = clock() + compact_interval
+
+    def check(self, route_class: str, caller: str) -> Tuple[BucketState, BucketState]:
+        """Charge `caller` for one `route_class` request.
+
+        Returns the caller's bucket state and the state of the bucket that
+        decided the outcome (the caller's own, or the Gemini budget).
+        """
+        policy = self.policies[route_class]
+        charges = [
+            BucketCharge(
+                f"{route_class}:{caller}",
+                policy.capacity,
+                policy.refill_per_second,
+                1.0,
+            )
+        ]
+        if self.gemini_budget is not None:
+            charges.append(
+                BucketCharge(
+                    GEMINI_BUDGET_KEY,
+                    self.gemini_budget.capacity,
+                    self.gemini_budget.refill_per_second,
+                    policy.cost,
+                )
+            )
+        now = self._clock()
+        if now >= self._next_compaction:
+            self._next_compaction = now + self.compact_interval
+            self.backend.compact(now)
+        states = self.backend.acquire(charges, now)
+        limiting = next((state for state in states if not state.allowed), states[0])
+        return states[0], limiting
+
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+@lru_cache(maxsize=8)
+def parse_trusted_proxies(raw_value: str) -> Optional[Tuple[IPNetwork, ...]]:
+    """Parse FITOLA_TRUSTED_PROXIES: comma-separated IPs/CIDRs, or `*`.
+
+    Returns None for `*` (any peer is trusted) and an empty tuple when unset.
+    """
+    raw_value = raw_value.strip()
+    if raw_value == "*":
+        return None
+    try:
+        return tuple(
+            ipaddress.ip_network(entry.strip(), strict=False)
+            for entry in raw_value.split(",")
+            if entry.strip()
+        )
+    except ValueError as exc:
+        raise ValueError(f"FITOLA_TRUSTED_PROXIES is invalid: {exc}") from None
+
+
+def _is_trusted(address: str, trusted: Optional[Tuple[IPNetwork, ...]]) -> bool:
+    if trusted is None:
+        return True
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted)
+
+
+def client_ip(request: Request) -> str:
+    """The caller's IP, looking through trusted proxies only.
+
+    Behind a proxy every request arrives from the proxy's address, so all
+    callers would share one bucket. When FITOLA_TRUSTED_PROXIES lists the
+    proxy (or is `*`, e.g. on Vercel, which rewrites the header itself),
+    `X-Forwarded-For` is read from the right and the first address not in
+    the list is the client. It is off by default because a client talking
+    to the app directly can put anything in that header. Running uvicorn
+    with `--proxy-headers --forwarded-allow-ips=<proxy>` is equivalent.
+    """
+    host = request.client.host if request.client else "unknown"
+    trusted = parse_trusted_proxies(os.getenv("FITOLA_TRUSTED_PROXIES", ""))
+    if trusted == () or not _is_trusted(host, trusted):
+        return host
+    forwarded = [
+        address.strip()
+        for header in request.headers.getlist("x-forwarded-for")
+        for address in header.split(",")
+        if address.strip()
+    ]
+    for address in reversed(forwarded):
+        if trusted is None or not _is_trusted(address, trusted):
+            return address
+    return forwarded[0] if forwarded else host
+
+
+def client_identity(request: Request) -> str:
+    """Key callers by verified user id when present, otherwise by client IP.
+
+    Bearer tokens are never verified by this app, so keying by them would
+    let a client mint a fresh bucket per request with a random token. Auth
+    middleware that has verified the caller sets `request.state.user_id`.
+    """
+    user_id = getattr(request.state, "user_id", None)
+    if user_id:
+        return f"user:{user_id}"
+    return f"ip:{client_ip(request)}"
+
+
+def rate_limit_headers(user: BucketState, limiting: BucketState) -> Dict[str, str]:
+    headers = {
+        "X-RateLimit-Limit": str(int(user.limit)),
+        "X-RateLimit-Remaining": str(int(user.remaining)),
+        "X-RateLimit-Reset": str(math.ceil(user.reset_after)),
+    }
+    if not limiting.allowed:
+        headers["Retry-After"] = str(max(1, math.ceil(limiting.retry_after)))
+    return headers
+
+
+def parse_rate_limit_policy(
+    name: str, default: str, cost: float = 1.0
+) -> RateLimitPolicy:
+    """Parse `<requests>/<seconds>` from the environment variable `name`."""
+    raw_value = os.getenv(name, default)
+    requests, _, seconds = raw_value.partition("/")
+    try:
+        capacity = float(requests)
+        period = float(seconds)
+    except ValueError:
+        raise ValueError(
+            f"{name} must look like '<requests>/<seconds>' (got '{raw_value}')."
+        )
+    if capacity <= 0 or period <= 0:
+        raise ValueError(f"{name} must use positive numbers (got '{raw_value}').")
+    return RateLimitPolicy(capacity, capacity / period, cost)
+
+
+def create_rate_limiter_from_env(
+    backend: Optional[RateLimitBackend] = None,
+) -> Optional[RateLimiter]:
+    """Build the limiter from FITOLA_RATE_LIMIT_* settings, or None if disabled."""
+    if os.getenv("FITOLA_RATE_LIMIT_ENABLED", "1").strip().lower() in {
+        "0",
+        "false",
+        "no",
+    }:
+        return None
+    policies = {
+        "chat": parse_rate_limit_policy("FITOLA_RATE_LIMIT_CHAT", "20/60", cost=1),
+        "plans": parse_rate_limit_policy("FITOLA_RATE_LIMIT_PLANS", "5/300", cost=4),
+        "translate": parse_rate_limit_policy(
+            "FITOLA_RATE_LIMIT_TRANSLATE", "30/60", cost=1
+        ),
+    }
+    gemini_budget = parse_rate_limit_policy("FITOLA_GEMINI_BUDGET", "240/60")
+    # Fail at startup, not on every request, if the proxy list is invalid.
+    parse_trusted_proxies(os.getenv("FITOLA_TRUSTED_PROXIES", ""))
+    return RateLimiter(policies, gemini_budget, backend)
+
+
+def enforce_rate_limit(
+    limiter: Optional[RateLimiter],
+    route_class: str,
+    request: Request,
+    response: Response,
+) -> None:
+    """Charge the caller, set rate-limit headers, or raise 429."""
+    if limiter is None:
+        return
+    user_state, limiting = limiter.check(route_class, client_identity(request))
+    headers = rate_limit_headers(user_state, limiting)
+    if not limiting.allowed:
+        detail = (
+            "Rate limit exceeded. Please retry later."
+            if limiting is user_state
+            else "AI capacity is temporarily exhausted. Please retry later."
+        )
+        raise HTTPException(status_code=429, detail=detail, headers=headers)
+    response.headers.update(headers)
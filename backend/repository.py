@@ -0,0 +1,853 @@
+"""Persistence layer for user profiles and chat messages.
+
+Writes are buffered in memory and flushed by a background thread as
+multi-row statements: repeated profile updates for the same user are
+coalesced into one row per flush, and chat messages are appended in bulk.
+Profile reads go through an LRU cache in front of the backend, and pending
+(not yet flushed) writes are overlaid on every read so callers always see
+their own updates.
+
+A queued profile carrying `email` and `name` (registration) is inserted,
+and skipped if the id already exists; anything else is a partial `UPDATE`
+of an existing row. Rows the backend
+rejects are retried on their own with exponential backoff and moved to
+`UserRepository.dead_letters` after `max_attempts`, so one bad row never
+blocks the rest of the queue.
+
+Two backends are provided: SQLite (tests, local development and load
+testing) and Supabase (production). Table layouts follow the `users` and
+`chat_messages` tables documented in docs/TECHNICAL.md.
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILE_COLUMNS: Tuple[str, ...] = (
+    "id",
+    "email",
+    "name",
+    "weight",
+    "height",
+    "age_group",
+    "body_type",
+    "goals",
+    "city",
+    "allergies",
+    "created_at",
+    "updated_at",
+)
+MESSAGE_COLUMNS: Tuple[str, ...] = (
+    "id",
+    "sender_id",
+    "receiver_id",
+    "message",
+    "type",
+    "file_url",
+    "timestamp",
+    "is_read",
+)
+JSON_COLUMNS = frozenset({"goals", "allergies"})
+# Columns that are NOT NULL in `users`; only rows carrying them can insert.
+REQUIRED_PROFILE_COLUMNS: Tuple[str, ...] = ("email", "name")
+
+# Backend reads per `get_profile` while concurrent flushes keep racing it.
+PROFILE_READ_ATTEMPTS = 3
+
+# Rows per multi-row INSERT. Keeps the bound parameter count well below
+# SQLite's variable limit while still amortising statement overhead.
+SQLITE_INSERT_CHUNK = 50
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    name TEXT NOT NULL,
+    weight REAL,
+    height REAL,
+    age_group TEXT,
+    body_type TEXT,
+    goals TEXT,
+    city TEXT,
+    allergies TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS chat_messages (
+    id TEXT PRIMARY KEY,
+    sender_id TEXT NOT NULL,
+    receiver_id TEXT NOT NULL,
+    message TEXT NOT NULL,
+    type TEXT DEFAULT 'text',
+    file_url TEXT,
+    timestamp TEXT NOT NULL,
+    is_read INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_chat_messages_pair
+    ON chat_messages(sender_id, receiver_id, timestamp);
+"""
+
+
+class RepositoryBackend:
+    """Storage operations used by `UserRepository`."""
+
+    def insert_profiles(self, rows: Sequence[Dict[str, Any]]) -> None:
+        """Insert complete profile rows; ids that already exist are skipped."""
+        raise NotImplementedError
+
+    def update_profiles(self, rows: Sequence[Dict[str, Any]]) -> None:
+        """Apply partial updates to existing profile rows."""
+        raise NotImplementedError
+
+    def insert_messages(self, rows: Sequence[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def fetch_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def fetch_conversation(
+        self, user_id: str, other_user_id: str, limit: int
+    ) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+# =============================================================================
+# SQLite
+# =============================================================================
+
+
+class SQLiteConnectionPool:
+    """Fixed-size pool of SQLite connections shared across threads.
+
+    Each connection keeps its own prepared statement cache, so reusing
+    connections (rather than opening one per request) also reuses compiled
+    statements. An in-memory database only exists inside a single
+    connection, so `:memory:` pools are capped at one connection.
+    """
+
+    def __init__(
+        self, path: str, size: int = 4, statement_cache_size: int = 128
+    ) -> None:
+        if size < 1:
+            raise ValueError(f"SQLite pool size must be at least 1 (got {size}).")
+        self.path = path
+        self.in_memory = path == ":memory:"
+        self.size = 1 if self.in_memory else size
+        self._statement_cache_size = statement_cache_size
+        self._connections: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all: List[sqlite3.Connection] = []
+        for _ in range(self.size):
+            connection = self._connect()
+            self._all.append(connection)
+            self._connections.put(connection)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=self._statement_cache_size,
+        )
+        connection.row_factory = sqlite3.Row
+        if not self.in_memory:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+        return connection
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        connection = self._connections.get()
+        try:
+            yield connection
+        finally:
+            self._connections.put(connection)
+
+    def close(self) -> None:
+        for connection in self._all:
+            connection.close()
+        self._all.clear()
+
+
+@lru_cache(maxsize=None)
+def _multi_row_sql(head: str, width: int, rows: int, tail: str = "") -> str:
+    """Build (and memoise) an INSERT with `rows` placeholder groups.
+
+    Returning the identical string for the same shape lets sqlite3's
+    per-connection statement cache hand back the already prepared statement.
+    """
+    group = "(" + ", ".join("?" * width) + ")"
+    return f"{head} VALUES {', '.join([group] * rows)}{tail}"
+
+
+def _encode_row(row: Dict[str, Any], columns: Sequence[str]) -> List[Any]:
+    values = []
+    for column in columns:
+        value = row.get(column)
+        if column in JSON_COLUMNS and value is not None:
+            value = json.dumps(value)
+        values.append(value)
+    return values
+
+
+def _decode_row(row: sqlite3.Row) -> Dict[str, Any]:
+    decoded = dict(row)
+    for column in JSON_COLUMNS.intersection(decoded):
+        if decoded[column] is not None:
+            decoded[column] = json.loads(decoded[column])
+    if "is_read" in decoded:
+        decoded["is_read"] = bool(decoded["is_read"])
+    return decoded
+
+
+class SQLiteBackend(RepositoryBackend):
+    """SQLite storage used for tests and local load testing."""
+
+    _PROFILE_HEAD = f"INSERT INTO users ({', '.join(PROFILE_COLUMNS)})"
+    # Registering an existing id must not overwrite that user.
+    _PROFILE_TAIL = " ON CONFLICT(id) DO NOTHING"
+    # Same statement text for every partial update, so it is prepared once.
+    _UPDATE_PROFILE = (
+        "UPDATE users SET "
+        + ", ".join(
+            f"{column} = COALESCE(?, {column})"
+            for column in PROFILE_COLUMNS
+            if column != "id"
+        )
+        + " WHERE id = ?"
+    )
+    _MESSAGE_HEAD = f"INSERT INTO chat_messages ({', '.join(MESSAGE_COLUMNS)})"
+    # Only duplicate ids are skipped; `OR IGNORE` would also hide NOT NULL
+    # violations and silently drop the row.
+    _MESSAGE_TAIL = " ON CONFLICT(id) DO NOTHING"
+    _SELECT_PROFILE = f"SELECT {', '.join(PROFILE_COLUMNS)} FROM users WHERE id = ?"
+    _SELECT_CONVERSATION = (
+        f"SELECT {', '.join(MESSAGE_COLUMNS)} FROM chat_messages "
+        "WHERE (sender_id = ? AND receiver_id = ?) "
+        "OR (sender_id = ? AND receiver_id = ?) "
+        "ORDER BY timestamp DESC LIMIT ?"
+    )
+
+    def __init__(self, path: str = ":memory:", pool_size: int = 4) -> None:
+        self.pool = SQLiteConnectionPool(path, size=pool_size)
+        with self.pool.connection() as connection:
+            connection.executescript(SQLITE_SCHEMA)
+
+    def _insert_many(
+        self,
+        head: str,
+        columns: Sequence[str],
+        rows: Sequence[Dict[str, Any]],
+        tail: str = "",
+    ) -> None:
+        width = len(columns)
+        with self.pool.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for start in range(0, len(rows), SQLITE_INSERT_CHUNK):
+                    chunk = rows[start : start + SQLITE_INSERT_CHUNK]
+                    params: List[Any] = []
+                    for row in chunk:
+                        params.extend(_encode_row(row, columns))
+                    connection.execute(
+                        _multi_row_sql(head, width, len(chunk), tail), params
+                    )
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def insert_profiles(self, rows: Sequence[Dict[str, Any]]) -> None:
+        self._insert_many(self._PROFILE_HEAD, PROFILE_COLUMNS, rows, self._PROFILE_TAIL)
+
+    def update_profiles(self, rows: Sequence[Dict[str, Any]]) -> None:
+        columns = [column for column in PROFILE_COLUMNS if column != "id"]
+        params = [_encode_row(row, columns) + [row["id"]] for row in rows]
+        with self.pool.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany(self._UPDATE_PROFILE, params)
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def insert_messages(self, rows: Sequence[Dict[str, Any]]) -> None:
+        self._insert_many(self._MESSAGE_HEAD, MESSAGE_COLUMNS, rows, self._MESSAGE_TAIL)
+
+    def fetch_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self.pool.connection() as connection:
+            row = connection.execute(self._SELECT_PROFILE, (user_id,)).fetchone()
+        return _decode_row(row) if row is not None else None
+
+    def fetch_conversation(
+        self, user_id: str, other_user_id: str, limit: int
+    ) -> List[Dict[str, Any]]:
+        with self.pool.connection() as connection:
+            rows = connection.execute(
+                self._SELECT_CONVERSATION,
+                (user_id, other_user_id, other_user_id, user_id, limit),
+            ).fetchall()
+        return [_decode_row(row) for row in reversed(rows)]
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+# =============================================================================
+# Supabase
+# =============================================================================
+
+
+class SupabaseBackend(RepositoryBackend):
+    """Supabase (PostgREST) storage.
+
+    A single client is shared by all threads; its underlying HTTP session
+    keeps connections alive, and PostgREST prepares statements server-side.
+
+    PostgREST has no multi-row UPDATE, so each partial profile update is
+    its own request (counted as `profile_rows_updated` in the repository
+    stats); registrations and chat messages go out as multi-row inserts.
+    """
+
+    def __init__(self, url: str, key: str) -> None:
+        from supabase import create_client
+
+        self._client = create_client(url, key)
+
+    def insert_profiles(self, rows: Sequence[Dict[str, Any]]) -> None:
+        # PostgREST derives the column list from the payload, so rows that
+        # carry different columns go out as separate multi-row inserts.
+        # Otherwise missing columns would be written as NULL.
+        groups: Dict[frozenset, List[Dict[str, Any]]] = {}
+        for row in rows:
+            groups.setdefault(frozenset(row), []).append(row)
+        for group in groups.values():
+            self._client.table("users").upsert(
+                group, on_conflict="id", ignore_duplicates=True
+            ).execute()
+
+    def update_profiles(self, rows: Sequence[Dict[str, Any]]) -> None:
+        # An upsert would trip the NOT NULL email/name checks before the
+        # conflict is resolved, and a bulk upsert is the only multi-row
+        # write PostgREST offers, so partial rows are one UPDATE each.
+        for row in rows:
+            values = {key: value for key, value in row.items() if key != "id"}
+            self._client.table("users").update(values).eq("id", row["id"]).execute()
+
+    def insert_messages(self, rows: Sequence[Dict[str, Any]]) -> None:
+        self._client.table("chat_messages").upsert(
+            list(rows), on_conflict="id", ignore_duplicates=True
+        ).execute()
+
+    def fetch_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        response = (
+            self._client.table("users")
+            .select(",".join(PROFILE_COLUMNS))
+            .eq("id", user_id)
+            .limit(1)
+            .execute()
+        )
+        return response.data[0] if response.data else None
+
+    def fetch_conversation(
+        self, user_id: str, other_user_id: str, limit: int
+    ) -> List[Dict[str, Any]]:
+        # One `.eq()` query per direction: ids are bound as values, never
+        # spliced into a PostgREST filter expression.
+        messages: List[Dict[str, Any]] = []
+        for sender_id, receiver_id in (
+            (user_id, other_user_id),
+            (other_user_id, user_id),
+        ):
+            response = (
+                self._client.table("chat_messages")
+                .select(",".join(MESSAGE_COLUMNS))
+                .eq("sender_id", sender_id)
+                .eq("receiver_id", receiver_id)
+                .order("timestamp", desc=True)
+                .limit(limit)
+                .execute()
+            )
+            messages.extend(response.data)
+        messages.sort(key=lambda message: message["timestamp"])
+        return messages[-limit:]
+
+
+# =============================================================================
+# Repository
+# =============================================================================
+
+
+class ProfileCache:
+    """LRU + TTL cache of profile rows. Not thread-safe on its own.
+
+    `generation` is bumped on every invalidation; a reader that fetched from
+    the backend only stores its result if no invalidation happened in the
+    meantime, so a slow read can never re-cache data older than a flush.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 30.0) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation = 0
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Dict[str, Any], generation: int) -> None:
+        if self.max_entries <= 0 or generation != self.generation:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        self.generation += 1
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _is_complete_profile(row: Dict[str, Any]) -> bool:
+    return all(row.get(column) is not None for column in REQUIRED_PROFILE_COLUMNS)
+
+
+def _merge_profile(
+    base: Optional[Dict[str, Any]], update: Optional[Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    if not update:
+        return base
+    merged = dict(base or {})
+    merged.update({key: value for key, value in update.items() if value is not None})
+    return merged
+
+
+class RepositoryFullError(RuntimeError):
+    """Raised when too many writes are queued to accept another one."""
+
+
+class UserRepository:
+    """Write-behind, read-through access to profiles and chat messages.
+
+    `save_profile` and `add_message` only enqueue; a background thread
+    flushes after `flush_interval` seconds, or immediately once
+    `batch_size` rows are waiting. Call `flush()` to force a write and
+    `close()` on shutdown so nothing buffered is lost. At most
+    `max_pending` rows are queued; further writes raise
+    `RepositoryFullError` until the backend catches up.
+    """
+
+    def __init__(
+        self,
+        backend: RepositoryBackend,
+        batch_size: int = 100,
+        flush_interval: float = 0.05,
+        cache_size: int = 1024,
+        cache_ttl: float = 30.0,
+        max_pending: int = 10_000,
+        max_attempts: int = 10,
+        retry_backoff: float = 0.5,
+        retry_backoff_max: float = 30.0,
+        dead_letter_size: int = 1000,
+    ) -> None:
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.stats: Dict[str, int] = {
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "flushes": 0,
+            "profile_rows_written": 0,
+            # Partial updates included in `profile_rows_written`.
+            "profile_rows_updated": 0,
+            "message_rows_written": 0,
+            "profile_updates_coalesced": 0,
+            "rows_retried": 0,
+            "rows_dead_lettered": 0,
+        }
+        # (table, row, error) for rows given up on after `max_attempts`.
+        self.dead_letters: Deque[Tuple[str, Dict[str, Any], str]] = deque(
+            maxlen=dead_letter_size
+        )
+        self._cache = ProfileCache(cache_size, cache_ttl)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending_profiles: Dict[str, Dict[str, Any]] = {}
+        self._pending_messages: List[Dict[str, Any]] = []
+        # Rows handed to the backend but not yet committed stay visible to
+        # readers until the flush finishes.
+        self._inflight_profiles: Dict[str, Dict[str, Any]] = {}
+        self._inflight_messages: List[Dict[str, Any]] = []
+        # Failed write attempts per ("users" | "chat_messages", row id).
+        self._attempts: Dict[Tuple[str, str], int] = {}
+        self._failed_flushes = 0
+        self._dirty = threading.Event()
+        self._full = threading.Event()
+        self._stopping = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(
+            target=self._run_flusher, name="fitola-repository-flusher", daemon=True
+        )
+        self._flusher.start()
+
+    # -- writes ---------------------------------------------------------------
+
+    def _check_accepting(self, new_rows: int) -> None:
+        if self._closed:
+            raise RuntimeError("UserRepository is closed.")
+        pending = len(self._pending_profiles) + len(self._pending_messages)
+        if pending + new_rows > self.max_pending:
+            raise RepositoryFullError(
+                f"{pending} writes are already queued (limit {self.max_pending})."
+            )
+
+    def save_profile(self, profile: Dict[str, Any]) -> None:
+        """Queue a (partial) profile write; `None` fields are left unchanged."""
+        user_id = profile["id"]
+        update = {key: value for key, value in profile.items() if value is not None}
+        with self._lock:
+            existing = self._pending_profiles.get(user_id)
+            self._check_accepting(0 if existing is not None else 1)
+            if existing is not None:
+                existing.update(update)
+                self.stats["profile_updates_coalesced"] += 1
+            else:
+                self._pending_profiles[user_id] = update
+            pending = len(self._pending_profiles) + len(self._pending_messages)
+        self._signal(pending)
+
+    def add_message(self, message: Dict[str, Any]) -> None:
+        """Queue a chat message row for insertion."""
+        with self._lock:
+            self._check_accepting(1)
+            self._pending_messages.append(dict(message))
+            pending = len(self._pending_profiles) + len(self._pending_messages)
+        self._signal(pending)
+
+    def _signal(self, pending: int) -> None:
+        self._dirty.set()
+        if pending >= self.batch_size:
+            self._full.set()
+
+    def _write_rows(
+        self,
+        table: str,
+        write: Callable[[Sequence[Dict[str, Any]]], None],
+        rows: List[Dict[str, Any]],
+    ) -> List[Tuple[Dict[str, Any], str]]:
+        """Write `rows` in one call, falling back to one call per row.
+
+        Returns the rows that still failed, with their errors.
+        """
+        if not rows:
+            return []
+        try:
+            write(rows)
+            return []
+        except Exception as exc:
+            if len(rows) == 1:
+                return [(rows[0], repr(exc))]
+            logger.warning(
+                "Batch write of %s %s rows failed (%s); retrying row by row.",
+                len(rows),
+                table,
+                exc,
+            )
+        failed = []
+        for row in rows:
+            try:
+                write([row])
+            except Exception as exc:
+                failed.append((row, repr(exc)))
+        return failed
+
+    def _record_failure(self, table: str, row: Dict[str, Any], error: str) -> bool:
+        """Count a failed attempt; return False once the row is dead-lettered."""
+        key = (table, row["id"])
+        attempts = self._attempts.get(key, 0) + 1
+        if attempts < self.max_attempts:
+            self._attempts[key] = attempts
+            self.stats["rows_retried"] += 1
+            return True
+        self._attempts.pop(key, None)
+        self.dead_letters.append((table, row, error))
+        self.stats["rows_dead_lettered"] += 1
+        logger.error(
+            "Dropping %s row %s after %s failed attempts: %s",
+            table,
+            row["id"],
+            attempts,
+            error,
+        )
+        return False
+
+    def flush(self) -> None:
+        """Write every queued row to the backend now.
+
+        Raises `RuntimeError` if any row failed; those rows are queued again
+        (or dead-lettered) and everything else has been written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                profiles = self._pending_profiles
+                messages = self._pending_messages
+                if not profiles and not messages:
+                    return
+                self._pending_profiles = {}
+                self._pending_messages = []
+                self._inflight_profiles = profiles
+                self._inflight_messages = messages
+            failed_profiles: List[Tuple[Dict[str, Any], str]] = []
+            failed_messages: List[Tuple[Dict[str, Any], str]] = []
+            updates = [
+                row for row in profiles.values() if not _is_complete_profile(row)
+            ]
+            try:
+                failed_profiles = self._write_rows(
+                    "users",
+                    self.backend.insert_profiles,
+                    [row for row in profiles.values() if _is_complete_profile(row)],
+                )
+                failed_updates = self._write_rows(
+                    "users", self.backend.update_profiles, updates
+                )
+                failed_profiles += failed_updates
+                with self._lock:
+                    self.stats["profile_rows_updated"] += len(updates) - len(
+                        failed_updates
+                    )
+                failed_messages = self._write_rows(
+                    "chat_messages", self.backend.insert_messages, messages
+                )
+            finally:
+                with self._lock:
+                    self._inflight_profiles = {}
+                    self._inflight_messages = []
+                    self._finish_flush(
+                        profiles, messages, failed_profiles, failed_messages
+                    )
+            failed = len(failed_profiles) + len(failed_messages)
+            if failed:
+                raise RuntimeError(f"{failed} queued rows could not be written.")
+
+    def _finish_flush(
+        self,
+        profiles: Dict[str, Dict[str, Any]],
+        messages: List[Dict[str, Any]],
+        failed_profiles: List[Tuple[Dict[str, Any], str]],
+        failed_messages: List[Tuple[Dict[str, Any], str]],
+    ) -> None:
+        """Account for a flush and queue failed rows again. Holds `_lock`."""
+        failed_profile_ids = {row["id"] for row, _ in failed_profiles}
+        failed_message_ids = {row["id"] for row, _ in failed_messages}
+        for user_id in profiles:
+            if user_id not in failed_profile_ids:
+                self._attempts.pop(("users", user_id), None)
+            self._cache.invalidate(user_id)
+        for message in messages:
+            if message["id"] not in failed_message_ids:
+                self._attempts.pop(("chat_messages", message["id"]), None)
+        self.stats["flushes"] += 1
+        self.stats["profile_rows_written"] += len(profiles) - len(failed_profiles)
+        self.stats["message_rows_written"] += len(messages) - len(failed_messages)
+
+        # Retried rows go back underneath anything queued since.
+        for row, error in failed_profiles:
+            if self._record_failure("users", row, error):
+                newer = self._pending_profiles.get(row["id"], {})
+                self._pending_profiles[row["id"]] = {**row, **newer}
+        retry_messages = [
+            row
+            for row, error in failed_messages
+            if self._record_failure("chat_messages", row, error)
+        ]
+        self._pending_messages = retry_messages + self._pending_messages
+        if failed_profiles or failed_messages:
+            self._dirty.set()
+
+    def _run_flusher(self) -> None:
+        while True:
+            self._dirty.wait()
+            if not self._closed:
+                # Give concurrent writers a window to coalesce into this batch.
+                self._full.wait(self.flush_interval)
+            self._dirty.clear()
+            self._full.clear()
+            # Checked after clearing so a concurrent close() is never lost;
+            # close() performs the final flush itself.
+            if self._closed:
+                return
+            try:
+                self.flush()
+                self._failed_flushes = 0
+            except Exception:
+                self._failed_flushes += 1
+                delay = min(
+                    self.retry_backoff * 2 ** (self._failed_flushes - 1),
+                    self.retry_backoff_max,
+                )
+                logger.exception(
+                    "Failed to flush queued writes; retrying in %.1fs.", delay
+                )
+                self._stopping.wait(delay)
+
+    def close(self) -> None:
+        """Stop the background flusher, write what is left and close the backend."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._stopping.set()
+        self._dirty.set()
+        self._full.set()
+        self._flusher.join()
+        try:
+            self.flush()
+        finally:
+            self.backend.close()
+
+    # -- reads ----------------------------------------------------------------
+
+    def _pending_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return _merge_profile(
+            self._inflight_profiles.get(user_id), self._pending_profiles.get(user_id)
+        )
+
+    def get_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return the stored profile with any queued updates applied."""
+        for _ in range(PROFILE_READ_ATTEMPTS):
+            with self._lock:
+                # Snapshot queued writes before touching the backend so a
+                # write flushed during the read is not missed.
+                overlay = self._pending_profile(user_id)
+                base = self._cache.get(user_id)
+                generation = self._cache.generation
+                if base is not None:
+                    self.stats["cache_hits"] += 1
+                    break
+                self.stats["cache_misses"] += 1
+            base = self.backend.fetch_profile(user_id)
+            with self._lock:
+                # Every flush bumps the generation. If none finished during
+                # the read, the backend holds nothing newer than `overlay`.
+                if self._cache.generation == generation:
+                    if base is not None:
+                        self._cache.put(user_id, base, generation)
+                    break
+                # `overlay` may predate what was just read; read again.
+                overlay = self._pending_profile(user_id)
+        merged = _merge_profile(base, overlay)
+        return dict(merged) if merged is not None else None
+
+    def get_conversation(
+        self, user_id: str, other_user_id: str, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """Return up to `limit` most recent messages between two users."""
+        pair = {(user_id, other_user_id), (other_user_id, user_id)}
+        with self._lock:
+            queued = [
+                dict(message)
+                for message in self._inflight_messages + self._pending_messages
+                if (message["sender_id"], message["receiver_id"]) in pair
+            ]
+        messages = self.backend.fetch_conversation(user_id, other_user_id, limit)
+        seen = {message["id"] for message in messages}
+        messages.extend(message for message in queued if message["id"] not in seen)
+        messages.sort(key=lambda message: message["timestamp"])
+        return messages[-limit:] if limit else []
+
+
+# =============================================================================
+# Configuration
+# =============================================================================
+
+
+def _env_number(name: str, default: str, cast: Any, minimum: float) -> Any:
+    raw_value = os.getenv(name, default)
+    try:
+        value = cast(raw_value)
+    except ValueError:
+        raise ValueError(f"{name} must be a valid number (got '{raw_value}').")
+    if value < minimum:
+        raise ValueError(f"{name} must be at least {minimum} (got '{raw_value}').")
+    return value
+
+
+def configured_backend_name() -> str:
+    """'supabase' or 'sqlite' (or whatever unknown name FITOLA_DB_BACKEND holds)."""
+    backend_name = os.getenv("FITOLA_DB_BACKEND", "").strip().lower()
+    if backend_name:
+        return backend_name
+    if os.getenv("SUPABASE_URL") and os.getenv("SUPABASE_KEY"):
+        return "supabase"
+    return "sqlite"
+
+
+def create_repository_from_env() -> UserRepository:
+    """Build the repository configured by the FITOLA_DB_* environment.
+
+    Supabase is used when FITOLA_DB_BACKEND=supabase, or when it is unset
+    and SUPABASE_URL/SUPABASE_KEY are present; otherwise SQLite at
+    FITOLA_SQLITE_PATH (default in-memory).
+    """
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_KEY")
+    backend_name = configured_backend_name()
+
+    backend: RepositoryBackend
+    if backend_name == "supabase":
+        if not supabase_url or not supabase_key:
+            raise ValueError(
+                "SUPABASE_URL and SUPABASE_KEY must be set for the Supabase backend."
+            )
+        backend = SupabaseBackend(supabase_url, supabase_key)
+    elif backend_name == "sqlite":
+        backend = SQLiteBackend(
+            os.getenv("FITOLA_SQLITE_PATH", ":memory:"),
+            pool_size=_env_number("FITOLA_DB_POOL_SIZE", "4", int, 1),
+        )
+    else:
+        raise ValueError(
+            f"FITOLA_DB_BACKEND must be 'sqlite' or 'supabase' (got '{backend_name}')."
+        )
+
+    return UserRepository(
+        backend,
+        batch_size=_env_number("FITOLA_DB_BATCH_SIZE", "100", int, 1),
+        flush_interval=_env_number("FITOLA_DB_FLUSH_INTERVAL", "0.05", float, 0),
+        cache_size=_env_number("FITOLA_PROFILE_CACHE_SIZE", "1024", int, 0),
+        cache_ttl=_env_number("FITOLA_PROFILE_CACHE_TTL", "30", float, 0),
+        max_pending=_env_number("FITOLA_DB_MAX_PENDING", "10000", int, 1),
+        max_attempts=_env_number("FITOLA_DB_MAX_ATTEMPTS", "10", int, 1),
+        retry_backoff=_env_number("FITOLA_DB_RETRY_BACKOFF", "0.5", float, 0),
+        retry_backoff_max=_env_number("FITOLA_DB_RETRY_BACKOFF_MAX", "30", float, 0),
+    )
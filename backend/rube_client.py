@@ -0,0 +1,425 @@
+"""Resilient HTTP client for the Rube MCP API.
+
+Wraps a pooled `httpx.AsyncClient` (configurable limits, keep-alive and
+optional HTTP/2) with:
+
+- jittered exponential-backoff retries for idempotent requests, capped by a
+  `RetryBudget` so a struggling upstream is not hit by a retry storm;
+- a `CircuitBreaker` that fails fast while Rube is down and lets a single
+  probe through once the cool-down has passed;
+- per-host metrics (requests, in-flight, new connections, status classes,
+  latency) collected by `MetricsTransport`.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = frozenset({502, 503, 504})
+
+
+@dataclass(frozen=True)
+class RubeClientConfig:
+    timeout: float = 10.0
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    max_retries: int = 2
+    retry_backoff: float = 0.1
+    retry_backoff_max: float = 2.0
+    retry_budget_ratio: float = 0.2
+    retry_budget_min_per_second: float = 1.0
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout: float = 30.0
+
+
+def _env_number(name: str, default: Any, cast: Callable[[str], Any], minimum: float):
+    raw_value = os.getenv(name)
+    if raw_value is None:
+        return default
+    try:
+        value = cast(raw_value)
+    except ValueError:
+        raise ValueError(f"{name} must be a valid number (got '{raw_value}').")
+    if value < minimum:
+        raise ValueError(f"{name} must be at least {minimum} (got '{raw_value}').")
+    return value
+
+
+def load_rube_client_config(timeout: float) -> RubeClientConfig:
+    """Read pool, retry and circuit breaker settings from RUBE_MCP_* variables."""
+    defaults = RubeClientConfig()
+    return RubeClientConfig(
+        timeout=timeout,
+        max_connections=_env_number(
+            "RUBE_MCP_MAX_CONNECTIONS", defaults.max_connections, int, 1
+        ),
+        max_keepalive_connections=_env_number(
+            "RUBE_MCP_MAX_KEEPALIVE", defaults.max_keepalive_connections, int, 0
+        ),
+        keepalive_expiry=_env_number(
+            "RUBE_MCP_KEEPALIVE_EXPIRY", defaults.keepalive_expiry, float, 0
+        ),
+        http2=os.getenv("RUBE_MCP_HTTP2", "0").strip().lower() in {"1", "true", "yes"},
+        max_retries=_env_number("RUBE_MCP_MAX_RETRIES", defaults.max_retries, int, 0),
+        retry_backoff=_env_number(
+            "RUBE_MCP_RETRY_BACKOFF", defaults.retry_backoff, float, 0
+        ),
+        retry_backoff_max=_env_number(
+            "RUBE_MCP_RETRY_BACKOFF_MAX", defaults.retry_backoff_max, float, 0
+        ),
+        retry_budget_ratio=_env_number(
+            "RUBE_MCP_RETRY_BUDGET_RATIO", defaults.retry_budget_ratio, float, 0
+        ),
+        retry_budget_min_per_second=_env_number(
+            "RUBE_MCP_RETRY_BUDGET_MIN_PER_SECOND",
+            defaults.retry_budget_min_per_second,
+            float,
+            0,
+        ),
+        breaker_failure_threshold=_env_number(
+            "RUBE_MCP_BREAKER_THRESHOLD", defaults.breaker_failure_threshold, int, 1
+        ),
+        breaker_reset_timeout=_env_number(
+            "RUBE_MCP_BREAKER_RESET", defaults.breaker_reset_timeout, float, 0
+        ),
+    )
+
+
+class RetryBudget:
+    """Limit retries to a fraction of recent traffic.
+
+    Every request deposits `ratio` tokens and every retry withdraws one, so
+    sustained retries stay below `ratio` x requests. A trickle of
+    `min_per_second` tokens keeps low-traffic callers able to retry. The
+    balance is capped so an idle period cannot bank a burst of retries.
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.2,
+        min_per_second: float = 1.0,
+        max_balance: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self._clock = clock
+        self._balance = max_balance
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._balance = min(
+            self.max_balance,
+            self._balance + (now - self._updated_at) * self.min_per_second,
+        )
+        self._updated_at = now
+
+    def record_request(self) -> None:
+        with self._lock:
+            self._refill()
+            self._balance = min(self.max_balance, self._balance + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+    @property
+    def balance(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._balance
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Circuit open; retry in {retry_after:.1f}s.")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open probe -> closed."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def before_request(self) -> bool:
+        """Raise `CircuitOpenError` unless a request may go out now.
+
+        Returns True when this request is the single half-open probe.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return False
+            remaining = self._opened_at + self.reset_timeout - self._clock()
+            if self._state == self.OPEN and remaining <= 0:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            raise CircuitOpenError(max(remaining, 0.0))
+
+    def abandon_request(self, probe: bool) -> None:
+        """Forget a request that ended without an upstream result.
+
+        Only the probe itself (`before_request()` returned True) frees the
+        probe slot; other abandoned requests leave it alone.
+        """
+        if not probe:
+            return
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if (
+                self._state == self.HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._probe_in_flight = False
+
+
+@dataclass
+class HostMetrics:
+    requests: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+    connections_opened: int = 0
+    transport_errors: int = 0
+    responses: Dict[str, int] = field(default_factory=dict)
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        completed = sum(self.responses.values()) + self.transport_errors
+        return {
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "connections_opened": self.connections_opened,
+            "connection_reuse_ratio": (
+                round(1 - self.connections_opened / self.requests, 4)
+                if self.requests
+                else 0.0
+            ),
+            "transport_errors": self.transport_errors,
+            "responses": dict(self.responses),
+            "avg_latency_ms": (
+                round(self.total_latency / completed * 1000, 3) if completed else 0.0
+            ),
+            "max_latency_ms": round(self.max_latency * 1000, 3),
+        }
+
+
+class MetricsTransport(httpx.AsyncBaseTransport):
+    """Record per-host request and connection metrics around another transport.
+
+    New connections are counted through httpcore's `trace` extension, so
+    they are only seen with the default pooled transport.
+    """
+
+    def __init__(self, inner: httpx.AsyncBaseTransport) -> None:
+        self.inner = inner
+        self.hosts: Dict[str, HostMetrics] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.netloc.decode("ascii")
+        metrics = self.hosts.get(host)
+        if metrics is None:
+            metrics = self.hosts[host] = HostMetrics()
+        upstream_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                metrics.connections_opened += 1
+            if upstream_trace is not None:
+                await upstream_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        metrics.requests += 1
+        metrics.in_flight += 1
+        metrics.max_in_flight = max(metrics.max_in_flight, metrics.in_flight)
+        started = time.perf_counter()
+        try:
+            response = await self.inner.handle_async_request(request)
+        except httpx.TransportError:
+            metrics.transport_errors += 1
+            raise
+        finally:
+            metrics.in_flight -= 1
+            elapsed = time.perf_counter() - started
+            metrics.total_latency += elapsed
+            metrics.max_latency = max(metrics.max_latency, elapsed)
+        status_class = f"{response.status_code // 100}xx"
+        metrics.responses[status_class] = metrics.responses.get(status_class, 0) + 1
+        return response
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class RubeClient:
+    """Pooled Rube MCP client with retries, retry budget and circuit breaker."""
+
+    def __init__(
+        self,
+        config: RubeClientConfig,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+        rng: Callable[[], float] = random.random,
+    ) -> None:
+        self.config = config
+        http2 = config.http2
+        if http2 and transport is None and not _http2_available():
+            logger.warning(
+                "RUBE_MCP_HTTP2 is enabled but the h2 package is missing; "
+                "install httpx[http2]. Falling back to HTTP/1.1."
+            )
+            http2 = False
+        limits = httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        )
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+        self.transport = MetricsTransport(transport)
+        self.http = httpx.AsyncClient(timeout=config.timeout, transport=self.transport)
+        self.retry_budget = RetryBudget(
+            config.retry_budget_ratio, config.retry_budget_min_per_second, clock=clock
+        )
+        self.breaker = CircuitBreaker(
+            config.breaker_failure_threshold, config.breaker_reset_timeout, clock=clock
+        )
+        self.counters = {
+            "retries": 0,
+            "retries_denied_by_budget": 0,
+            "circuit_rejections": 0,
+        }
+        self._sleep = sleep
+        self._rng = rng
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": uniform in [0, min(cap, base * 2^attempt)].
+        ceiling = min(
+            self.config.retry_backoff_max, self.config.retry_backoff * 2**attempt
+        )
+        return self._rng() * ceiling
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        """GET with retries on transport errors and 502/503/504 responses.
+
+        Raises `CircuitOpenError` when the breaker is open, otherwise returns
+        the last response or re-raises the last transport error.
+        """
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            try:
+                probe = self.breaker.before_request()
+            except CircuitOpenError:
+                self.counters["circuit_rejections"] += 1
+                raise
+            error: Optional[httpx.TransportError] = None
+            response: Optional[httpx.Response] = None
+            try:
+                response = await self.http.get(url, **kwargs)
+            except httpx.TransportError as exc:
+                error = exc
+            except BaseException:
+                # Cancelled or failed locally; says nothing about Rube.
+                self.breaker.abandon_request(probe)
+                raise
+            failed = error is not None or response.status_code in RETRYABLE_STATUS_CODES
+            if failed:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+                return response
+
+            if attempt >= self.config.max_retries:
+                break
+            if not self.retry_budget.try_withdraw():
+                self.counters["retries_denied_by_budget"] += 1
+                break
+            if response is not None:
+                await response.aclose()
+            attempt += 1
+            self.counters["retries"] += 1
+            await self._sleep(self._backoff(attempt))
+
+        if error is not None:
+            raise error
+        return response
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "hosts": {
+                host: metrics.snapshot()
+                for host, metrics in self.transport.hosts.items()
+            },
+            "circuit_state": self.breaker.state,
+            "retry_budget_balance": round(self.retry_budget.balance, 3),
+            **self.counters,
+        }
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
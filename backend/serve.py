@@ -0,0 +1,121 @@
+"""Run the API with several uvicorn workers sharing one copy of hot state.
+
+    python serve.py --workers 4 --port 8000
+
+This process owns the hot state (see `hot_state.HotStateOwner`): it creates
+the shared segments, applies writes sent by workers and publishes new
+snapshots. Workers inherit the segment location through the environment and
+map the snapshots read-only. It also holds the rate-limit buckets, so the
+FITOLA_RATE_LIMIT_* and FITOLA_GEMINI_BUDGET limits apply to the whole
+deployment rather than to each worker. `python main.py` keeps the
+single-process mode.
+
+State that is still per worker:
+
+- Profiles and chat messages. Every worker needs the same database, so an
+  in-memory SQLite database is refused; use Supabase or point
+  FITOLA_SQLITE_PATH at a file. The profile cache is turned off
+  (FITOLA_PROFILE_CACHE_SIZE=0), or a worker could serve a profile another
+  worker has since changed. Each worker's write-behind queue still reaches
+  the database only when it flushes, so other workers see a write after at
+  most FITOLA_DB_FLUSH_INTERVAL.
+- The Gemini client and the Rube HTTP client. Each worker has its own
+  connection pool, retry budget and circuit breaker, so the Rube connection
+  limits apply per worker.
+"""
+
+import argparse
+import logging
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+
+from hot_state import DEFAULT_SEGMENT_SIZE, HotStateOwner
+from rate_limit import rate_limit_services
+from repository import configured_backend_name
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("FITOLA_HOST", "0.0.0.0"))
+    parser.add_argument(
+        "--port", type=int, default=int(os.getenv("FITOLA_PORT", "8000"))
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("FITOLA_WORKERS", str(os.cpu_count() or 1))),
+    )
+    parser.add_argument(
+        "--segment-mb",
+        type=int,
+        default=int(
+            os.getenv("FITOLA_HOT_STATE_SEGMENT_MB", str(DEFAULT_SEGMENT_SIZE // 2**20))
+        ),
+        help="Size of each hot state namespace segment.",
+    )
+    parser.add_argument(
+        "--publish-interval",
+        type=float,
+        default=float(os.getenv("FITOLA_HOT_STATE_PUBLISH_INTERVAL", "0.1")),
+        help="Seconds between snapshot publishes; bounds write visibility lag.",
+    )
+    return parser
+
+
+def check_repository_settings() -> None:
+    """Refuse repository settings that would give each worker its own data."""
+    if (
+        configured_backend_name() == "sqlite"
+        and os.getenv("FITOLA_SQLITE_PATH", ":memory:").strip() == ":memory:"
+    ):
+        raise SystemExit(
+            "An in-memory SQLite database would be separate in every worker. "
+            "Set FITOLA_SQLITE_PATH to a file or use Supabase."
+        )
+    cache_size = os.getenv("FITOLA_PROFILE_CACHE_SIZE", "0").strip()
+    if cache_size != "0":
+        logger.warning(
+            "Ignoring FITOLA_PROFILE_CACHE_SIZE=%s: each worker's cache would "
+            "keep serving profiles changed by another.",
+            cache_size,
+        )
+    os.environ["FITOLA_PROFILE_CACHE_SIZE"] = "0"
+
+
+def main() -> None:
+    # Before reading any setting, as main.py does for single-process runs.
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    args = build_parser().parse_args()
+    if args.workers < 1 or args.segment_mb < 1 or args.publish_interval <= 0:
+        raise SystemExit(
+            "--workers and --segment-mb must be at least 1 and "
+            "--publish-interval must be positive."
+        )
+    check_repository_settings()
+    owner = HotStateOwner(
+        segment_size=args.segment_mb * 2**20,
+        publish_interval=args.publish_interval,
+        services=rate_limit_services(),
+    )
+    os.environ.update(owner.worker_environment())
+    try:
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            app_dir=BACKEND_DIR,
+        )
+    finally:
+        owner.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from body_metrics import compute_body_metrics, compute_single_body_metrics
+from main import app
+
+client = TestClient(app)
+
+
+def test_mifflin_st_jeor_uses_age_and_sex():
+    metrics = compute_body_metrics(
+        [70, 60, 80],
+        [175, 165, 180],
+        age=[30, 40, None],
+        sex=["Male", "female", None],
+        activity_level=["sedentary", "moderate", None],
+    )
+    # 10*70 + 6.25*175 - 5*30 + 5, 10*60 + 6.25*165 - 5*40 - 161,
+    # 10*80 + 6.25*180 - 5*30 - 78 (unknown sex, default age)
+    assert metrics["bmr"].tolist() == [1648.8, 1270.2, 1697.0]
+    assert metrics["tdee"].tolist() == [1978.5, 1968.9, 2630.4]
+
+
+def test_bmi_categories_match_who_thresholds():
+    height = 100.0
+    metrics = compute_body_metrics([18.4, 18.5, 24.99, 25.0, 30.0], [height] * 5)
+    assert metrics["category"].tolist() == [
+        "Underweight",
+        "Normal",
+        "Normal",
+        "Overweight",
+        "Obese",
+    ]
+
+
+def test_goal_drives_calorie_target_and_macros():
+    metrics = compute_body_metrics(
+        [80, 80, 80],
+        [180, 180, 180],
+        age=[30, 30, 30],
+        sex=["male"] * 3,
+        goal=["Weight Loss", "Muscle Gain", "Improve Flexibility"],
+    )
+    tdee = metrics["tdee"][0]
+    assert metrics["target_calories"].tolist() == [
+        round(tdee * 0.8),
+        round(tdee * 1.1),
+        round(tdee),
+    ]
+    assert metrics["protein_g"].tolist() == [160.0, 144.0, 112.0]
+    calories = metrics["protein_g"] * 4 + metrics["carbs_g"] * 4 + metrics["fats_g"] * 9
+    np.testing.assert_allclose(calories, metrics["target_calories"], atol=2)
+
+
+def test_age_group_is_used_when_age_is_missing():
+    metrics = compute_body_metrics(
+        [70, 70], [175, 175], age=[None, 50], age_group=["Elder", "Elder"]
+    )
+    assert metrics["age"].tolist() == [70.0, 50.0]
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"weight_kg": [70, 0], "height_cm": [170, 170]},
+        {"weight_kg": [70], "height_cm": [170, 180]},
+        {"weight_kg": [70], "height_cm": [170], "activity_level": ["couch"]},
+    ],
+)
+def test_invalid_columns_raise(kwargs):
+    with pytest.raises(ValueError):
+        compute_body_metrics(**kwargs)
+
+
+def test_bmi_route_matches_cohort_row():
+    single = client.post("/api/v1/user/bmi", json={"weight": 72.3, "height": 176})
+    assert single.status_code == 200
+    assert single.json() == {
+        "bmi": 23.3,
+        "category": "Normal",
+        "healthy_range": {
+            "min": 18.5,
+            "max": 24.9,
+            "min_weight": 57.3,
+            "max_weight": 77.1,
+        },
+    }
+
+    cohort = client.post(
+        "/api/v1/user/metrics/cohort",
+        json={"weight_kg": [50, 72.3], "height_cm": [160, 176]},
+    ).json()
+    assert cohort["count"] == 2
+    assert cohort["metrics"]["bmi"][1] == single.json()["bmi"]
+    assert cohort["metrics"]["healthy_min_weight"][1] == 57.3
+
+
+def test_cohort_route_accepts_records():
+    users = [
+        {
+            "user_id": f"user-{index}",
+            "weight_kg": 60 + index,
+            "height_cm": 170,
+            "age": 25,
+            "sex": "female",
+            "activity_level": "active",
+            "goal": "Weight Loss",
+        }
+        for index in range(3)
+    ]
+    response = client.post(
+        "/api/v1/user/metrics/cohort", json={"users": users, "orient": "records"}
+    )
+    assert response.status_code == 200
+    records = response.json()["metrics"]
+    assert [record["user_id"] for record in records] == [
+        "user-0",
+        "user-1",
+        "user-2",
+    ]
+    expected = compute_single_body_metrics(
+        61, 170, age=25, sex="female", activity_level="active", goal="Weight Loss"
+    )
+    assert records[1] == {"user_id": "user-1", **expected}
+
+
+def test_cohort_route_rejects_bad_input():
+    response = client.post("/api/v1/user/metrics/cohort", json={"weight_kg": [70]})
+    assert response.status_code == 422
+    response = client.post(
+        "/api/v1/user/metrics/cohort",
+        json={"weight_kg": [70, 80], "height_cm": [170, -1]},
+    )
+    assert response.status_code == 422
+
+
+def test_cohort_route_bounds_every_item():
+    for payload in (
+        {"weight_kg": [1e308], "height_cm": [1]},
+        {"weight_kg": [70], "height_cm": [170], "age": [1e306]},
+        {"users": [{"weight_kg": 70, "height_cm": 0.5}]},
+    ):
+        response = client.post("/api/v1/user/metrics/cohort", json=payload)
+        assert response.status_code == 422, payload
+    response = client.post("/api/v1/user/bmi", json={"weight": 1e308, "height": 1})
+    assert response.status_code == 422
+
+
+def test_non_finite_ages_are_rejected():
+    with pytest.raises(ValueError):
+        compute_body_metrics([70], [170], age=[float("inf")])
+
+
+def test_non_positive_bmr_is_rejected():
+    with pytest.raises(ValueError):
+        compute_body_metrics([70, 10], [170, 50], age=[30, 120], sex=["m", "female"])
+    response = client.post(
+        "/api/v1/user/metrics/cohort",
+        json={
+            "weight_kg": [10],
+            "height_cm": [50],
+            "age": [120],
+            "sex": ["female"],
+        },
+    )
+    assert response.status_code == 422
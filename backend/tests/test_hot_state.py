@@ -0,0 +1,417 @@
+import multiprocessing
+import os
+import random
+import struct
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import serve
+from benchmarks.fakes import FakeGeminiClient
+from hot_state import (
+    NAMESPACES,
+    SEQ_OFFSETS,
+    HotStateOwner,
+    HotStateStore,
+    LocalHotState,
+    NamespaceConfig,
+    SharedHotState,
+    SharedSegment,
+    SnapshotTable,
+    cells_within,
+    create_hot_state_from_env,
+    encode_snapshot,
+    encode_value,
+    haversine_km,
+    location_cell,
+)
+from main import app
+from rate_limit import (
+    RateLimiter,
+    RateLimitPolicy,
+    RemoteRateLimitBackend,
+    rate_limit_services,
+)
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def owner():
+    owner = HotStateOwner(segment_size=1 << 20, publish_interval=3600)
+    yield owner
+    owner.close()
+
+
+def attach(owner: HotStateOwner) -> SharedHotState:
+    return SharedHotState(owner.directory, owner.address, owner.authkey)
+
+
+def wait_for(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_segment_lookup_matches_entries(tmp_path):
+    segment = SharedSegment(str(tmp_path / "segment"), 1 << 16, create=True)
+    assert segment.lookup("missing") is None
+    entries = {f"key-{index}": encode_value(index, None) for index in range(500)}
+    segment.publish(encode_snapshot(entries))
+    reader = SharedSegment(str(tmp_path / "segment"))
+    assert all(reader.lookup(key) == value for key, value in entries.items())
+    assert reader.lookup("key-500") is None
+
+    segment.publish(encode_snapshot({"only": b"1"}))
+    assert reader.generation == 2
+    assert reader.lookup("only") == b"1"
+    assert reader.lookup("key-1") is None
+    reader.close()
+    segment.close()
+
+
+def test_reader_retries_while_active_slot_is_rewritten(tmp_path, monkeypatch):
+    segment = SharedSegment(str(tmp_path / "segment"), 1 << 12, create=True)
+    segment.publish(encode_snapshot({"key": b"1"}))
+    slot = segment.generation & 1
+    # An odd sequence means a write to the slot is in progress.
+    segment._map[SEQ_OFFSETS[slot] : SEQ_OFFSETS[slot] + 8] = (3).to_bytes(8, "little")
+    monkeypatch.setattr("hot_state.MAX_READ_ATTEMPTS", 5)
+    with pytest.raises(RuntimeError):
+        segment.lookup("key")
+    segment._map[SEQ_OFFSETS[slot] : SEQ_OFFSETS[slot] + 8] = (4).to_bytes(8, "little")
+    assert segment.lookup("key") == b"1"
+    segment.close()
+
+
+def test_reader_retries_after_torn_offsets(tmp_path, monkeypatch):
+    segment = SharedSegment(str(tmp_path / "segment"), 1 << 12, create=True)
+    segment.publish(encode_snapshot({"key": b"1"}))
+    probe = segment._probe
+    calls = []
+
+    def torn_once(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise struct.error("unpack_from requires a buffer")
+        return probe(*args)
+
+    monkeypatch.setattr(segment, "_probe", torn_once)
+    assert segment.lookup("key") == b"1"
+    assert len(calls) == 2
+    segment.close()
+
+
+def test_snapshot_must_fit_slot(tmp_path):
+    segment = SharedSegment(str(tmp_path / "segment"), 256, create=True)
+    with pytest.raises(ValueError):
+        segment.publish(encode_snapshot({"key": b"x" * 200}))
+    segment.close()
+
+
+def test_patched_table_matches_a_fresh_encoding(tmp_path):
+    segment = SharedSegment(str(tmp_path / "segment"), 1 << 16, create=True)
+    table = SnapshotTable({f"key-{index}": b"0" for index in range(40)})
+    expected = {f"key-{index}": b"0" for index in range(40)}
+    rng = random.Random(7)
+    for step in range(300):
+        key = f"key-{rng.randrange(60)}"
+        if rng.random() < 0.3:
+            table.remove(key)
+            expected.pop(key, None)
+        elif key in expected or table.can_patch(1):
+            table.put(key, str(step).encode())
+            expected[key] = str(step).encode()
+        else:
+            table.reset(expected)
+        segment.publish(table.payload())
+        assert all(segment.lookup(key) == value for key, value in expected.items())
+        assert segment.lookup(f"key-{rng.randrange(60, 80)}") is None
+    assert segment.lookup("key-missing") is None
+    segment.close()
+
+
+def test_snapshot_patches_instead_of_rebuilding():
+    store = HotStateStore()
+    for index in range(1000):
+        store.set("locations", f"user-{index}", {"x": index})
+    store.snapshot("locations")
+    store.set("locations", "user-5", {"x": -5})
+    assert store.prepare_snapshot("locations") is None
+    store.delete("locations", "user-6")
+    assert store.prepare_snapshot("locations") is None
+    assert store.get("locations", "user-5") == {"x": -5}
+
+
+def test_expiry_does_not_need_the_encoded_values():
+    store = HotStateStore({"cache": NamespaceConfig(ttl=10)})
+    store.set("cache", "a", 1)
+    store.set("cache", "b", 2, ttl=100)
+    store.set("cache", "a", 3, ttl=1000)
+    store.entries["cache"] = {key: b"opaque" for key in store.entries["cache"]}
+    assert store.expire("cache", time.time() + 50) == 0
+    assert store.expire("cache", time.time() + 500) == 1
+    assert list(store.entries["cache"]) == ["a"]
+
+
+def test_store_moves_entries_between_index_cells():
+    store = HotStateStore()
+    store.set("locations", "a", {"x": 1}, index=("location_cells", "1:1"))
+    store.set("locations", "b", {"x": 2}, index=("location_cells", "1:1"))
+    assert store.get("location_cells", "1:1") == ["a", "b"]
+
+    store.set("locations", "a", {"x": 3}, index=("location_cells", "2:2"))
+    assert store.get("location_cells", "1:1") == ["b"]
+    assert store.get("location_cells", "2:2") == ["a"]
+
+    store.delete("locations", "b")
+    assert store.get("location_cells", "1:1") is None
+    assert store.get("locations", "b") is None
+
+
+def test_store_evicts_oldest_and_expires_entries():
+    store = HotStateStore({"cache": NamespaceConfig(max_entries=2)})
+    store.set("cache", "a", 1)
+    store.set("cache", "b", 2)
+    store.set("cache", "a", 3)
+    store.set("cache", "c", 4)
+    assert store.get("cache", "b") is None
+    assert store.get("cache", "a") == 3
+
+    store.set("cache", "short", 5, ttl=10)
+    assert store.get("cache", "short", now=time.time() + 11) is None
+
+
+def test_locations_expire():
+    assert NAMESPACES["locations"].ttl and NAMESPACES["locations"].max_entries
+    store = HotStateStore()
+    store.set("locations", "a", {"x": 1}, index=("location_cells", "1:1"))
+    later = time.time() + NAMESPACES["locations"].ttl + 1
+    assert store.get("locations", "a", now=later) is None
+
+
+def test_full_segment_evicts_oldest_and_keeps_publishing():
+    owner = HotStateOwner(segment_size=1 << 13, publish_interval=3600)
+    try:
+        state = attach(owner)
+        for index in range(200):
+            owner.apply(
+                (
+                    "set",
+                    "locations",
+                    f"user-{index}",
+                    {"latitude": 1.0, "padding": "x" * 40},
+                    None,
+                    ("location_cells", f"cell-{index}"),
+                )
+            )
+        owner.publish()
+        assert state.get("locations", "user-199") is not None
+        assert state.get("locations", "user-0") is None
+        assert state.get("location_cells", "cell-199") == ["user-199"]
+
+        owner.apply(("set", "locations", "late", {"latitude": 2.0}, None, None))
+        owner.publish()
+        assert state.get("locations", "late") == {"latitude": 2.0}
+        state.close()
+    finally:
+        owner.close()
+
+
+def test_worker_writes_become_visible_after_publish(owner):
+    state = attach(owner)
+    state.set("locations", "user-1", {"latitude": 1.0}, index=("location_cells", "c"))
+    assert state.get("locations", "user-1") is None
+
+    def published() -> bool:
+        owner.publish()
+        return state.get("locations", "user-1") is not None
+
+    wait_for(published)
+    assert state.get("locations", "user-1") == {"latitude": 1.0}
+    assert state.get("location_cells", "c") == ["user-1"]
+
+    state.delete("locations", "user-1")
+    wait_for(lambda: owner.publish() or state.get("locations", "user-1") is None)
+    state.close()
+
+
+def test_rate_limits_are_shared_by_workers():
+    limiter_owner = HotStateOwner(
+        segment_size=1 << 16, publish_interval=3600, services=rate_limit_services()
+    )
+    workers = [attach(limiter_owner), attach(limiter_owner)]
+    try:
+        limiters = [
+            RateLimiter(
+                {"chat": RateLimitPolicy(capacity=2, refill_per_second=0.001)},
+                None,
+                RemoteRateLimitBackend(worker.call),
+            )
+            for worker in workers
+        ]
+        assert limiters[0].check("chat", "alice")[1].allowed
+        assert limiters[1].check("chat", "alice")[1].allowed
+        assert not limiters[0].check("chat", "alice")[1].allowed
+        assert not limiters[1].check("chat", "alice")[1].allowed
+
+        with pytest.raises(RuntimeError):
+            workers[0].call("missing")
+    finally:
+        for worker in workers:
+            worker.close()
+        limiter_owner.close()
+
+    # With the owner gone, requests are let through rather than failed.
+    assert limiters[0].check("chat", "bob")[1].allowed
+
+
+def read_in_child(environment, queue) -> None:
+    state = SharedHotState(
+        environment["FITOLA_HOT_STATE_DIR"],
+        environment["FITOLA_HOT_STATE_ADDRESS"],
+        bytes.fromhex(environment["FITOLA_HOT_STATE_AUTHKEY"]),
+    )
+    queue.put(state.get("ai_cache", "greeting"))
+    state.close()
+
+
+def test_other_processes_read_the_same_segment(owner):
+    owner.apply(("set", "ai_cache", "greeting", "namaste", None, None))
+    owner.publish()
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    process = context.Process(
+        target=read_in_child, args=(owner.worker_environment(), queue)
+    )
+    process.start()
+    assert queue.get(timeout=10) == "namaste"
+    process.join(timeout=10)
+
+
+def test_owner_close_removes_segments():
+    owner = HotStateOwner(segment_size=1 << 16)
+    directory = owner.directory
+    assert sorted(os.listdir(directory)) == [
+        "ai_cache",
+        "location_cells",
+        "locations",
+        "rankings",
+        "writer.sock",
+    ]
+    owner.close()
+    assert not os.path.exists(directory)
+
+
+def test_hot_state_from_environment(monkeypatch):
+    monkeypatch.delenv("FITOLA_HOT_STATE_DIR", raising=False)
+    assert isinstance(create_hot_state_from_env(), LocalHotState)
+    monkeypatch.setenv("FITOLA_HOT_STATE_DIR", "/tmp")
+    monkeypatch.delenv("FITOLA_HOT_STATE_ADDRESS", raising=False)
+    with pytest.raises(ValueError):
+        create_hot_state_from_env()
+
+
+def test_cells_within_cover_nearby_points():
+    latitude, longitude = 18.52, 73.85
+    cells = set(cells_within(latitude, longitude, 5))
+    for d_lat, d_lon in [(0.04, 0.04), (-0.04, 0.04), (0.0, -0.045)]:
+        point = (latitude + d_lat, longitude + d_lon)
+        assert haversine_km(latitude, longitude, *point) < 7
+        if haversine_km(latitude, longitude, *point) <= 5:
+            assert location_cell(*point) in cells
+
+
+def test_nearby_returns_users_from_location_updates(monkeypatch):
+    monkeypatch.setattr(main, "HOT_STATE", LocalHotState())
+    for user_id, latitude, status in [
+        ("near", 18.53, "available"),
+        ("busy", 18.521, "busy"),
+        ("far", 19.5, "available"),
+    ]:
+        response = client.post(
+            "/api/v1/location/update",
+            json={
+                "user_id": user_id,
+                "latitude": latitude,
+                "longitude": 73.85,
+                "timestamp": "2026-01-01T00:00:00Z",
+                "status": status,
+            },
+        )
+        assert response.status_code == 200
+
+    response = client.get(
+        "/api/v1/map/nearby", params={"latitude": 18.52, "longitude": 73.85}
+    )
+    assert [user["id"] for user in response.json()["users"]] == ["busy", "near"]
+
+    response = client.get(
+        "/api/v1/map/nearby",
+        params={"latitude": 18.52, "longitude": 73.85, "status": "available"},
+    )
+    body = response.json()
+    assert body["total"] == 1
+    assert body["users"][0]["id"] == "near"
+    assert body["users"][0]["distance"] == pytest.approx(1.11, abs=0.01)
+
+
+def test_coordinates_out_of_range_are_rejected(monkeypatch):
+    monkeypatch.setattr(main, "HOT_STATE", LocalHotState())
+    response = client.post(
+        "/api/v1/location/update",
+        json={
+            "user_id": "u",
+            "latitude": 1e308,
+            "longitude": 73.85,
+            "timestamp": "2026-01-01T00:00:00Z",
+        },
+    )
+    assert response.status_code == 422
+    response = client.get(
+        "/api/v1/map/nearby", params={"latitude": 18.52, "longitude": 181}
+    )
+    assert response.status_code == 422
+
+
+def test_serve_refuses_per_worker_repository(monkeypatch):
+    monkeypatch.delenv("FITOLA_DB_BACKEND", raising=False)
+    monkeypatch.delenv("SUPABASE_URL", raising=False)
+    monkeypatch.delenv("FITOLA_SQLITE_PATH", raising=False)
+    monkeypatch.delenv("FITOLA_PROFILE_CACHE_SIZE", raising=False)
+    with pytest.raises(SystemExit):
+        serve.check_repository_settings()
+
+    monkeypatch.setenv("FITOLA_SQLITE_PATH", "/tmp/fitola.db")
+    serve.check_repository_settings()
+    assert os.environ["FITOLA_PROFILE_CACHE_SIZE"] == "0"
+
+    monkeypatch.setenv("FITOLA_PROFILE_CACHE_SIZE", "1000")
+    serve.check_repository_settings()
+    assert os.environ["FITOLA_PROFILE_CACHE_SIZE"] == "0"
+
+
+def test_translation_is_served_from_cache(monkeypatch):
+    fake = FakeGeminiClient()
+    monkeypatch.setattr(main, "HOT_STATE", LocalHotState())
+    monkeypatch.setattr(main, "GEMINI_API_KEY", "fake-gemini-key")
+    monkeypatch.setattr(main, "client", fake)
+    monkeypatch.setattr(main, "RATE_LIMITER", None)
+    monkeypatch.setattr(main, "RATE_LIMITER_INITIALIZED", True)
+    payload = {"text": "Hello", "source_language": "en", "target_language": "hi"}
+    first = client.post("/api/v1/translate", json=payload)
+    second = client.post("/api/v1/translate", json=payload)
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert fake.calls == 1
+
+
+def test_leaderboard_page_is_cached(monkeypatch):
+    state = LocalHotState()
+    monkeypatch.setattr(main, "HOT_STATE", state)
+    response = client.get("/api/v1/leaderboard/global", params={"limit": 3})
+    assert response.status_code == 200
+    assert state.get("rankings", "global:3:0") == response.json()
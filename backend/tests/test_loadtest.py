@@ -0,0 +1,91 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from benchmarks.fakes import LatencyProfile
+from benchmarks.loadtest import (
+    build_parser,
+    compare_reports,
+    install_fakes,
+    parse_mix,
+    run_load_test,
+)
+
+
+def test_parse_mix_rejects_unknown_routes():
+    assert parse_mix("map=2,chat=1") == {"map": 2.0, "chat": 1.0}
+    with pytest.raises(ValueError):
+        parse_mix("map=1,unknown=1")
+    with pytest.raises(ValueError):
+        parse_mix("map=0")
+
+
+def test_install_fakes_restores_app_state():
+    original_client = main.client
+    original_state = main.HOT_STATE
+    restore = install_fakes(LatencyProfile(), LatencyProfile(), users=50)
+    assert main.client is not original_client
+    assert main.HOT_STATE.get("locations", "loadtest-user-49") is not None
+    asyncio.run(main.RUBE_HTTP_CLIENT.aclose())
+    restore()
+    assert main.client is original_client
+    assert main.HOT_STATE is original_state
+
+
+def test_asgi_load_test_reports_every_route():
+    args = build_parser().parse_args(
+        [
+            "--transport",
+            "asgi",
+            "--requests",
+            "60",
+            "--concurrency",
+            "4",
+            "--warmup",
+            "0",
+            "--gemini-latency",
+            "0",
+            "--gemini-jitter",
+            "0",
+            "--rube-latency",
+            "0",
+            "--rube-jitter",
+            "0",
+        ]
+    )
+    mix = parse_mix(
+        "map=1,location=1,leaderboard=1,chat=1,translate=1,plans=1,recipes=1"
+    )
+    report = asyncio.run(run_load_test(args, mix))
+
+    assert report["summary"]["requests"] == 60
+    assert report["summary"]["errors"] == 0
+    assert set(report["routes"]) == set(mix)
+    for stats in report["routes"].values():
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+
+
+def test_compare_reports_flags_regressions():
+    def report(rps, p95):
+        stats = {"rps": rps, "p95_ms": p95}
+        return {"summary": stats, "routes": {"map": stats}}
+
+    comparison = compare_reports(report(100, 10), report(85, 10), threshold=0.1)
+    assert comparison["regressions"] == ["map", "overall"]
+    assert comparison["routes"]["map"]["rps_change"] == -0.15
+
+    comparison = compare_reports(report(100, 10), report(95, 10.5), threshold=0.1)
+    assert comparison["regressions"] == []
+
+
+def test_rube_transport_injects_failures():
+    from benchmarks.fakes import make_rube_transport
+
+    async def fetch():
+        transport = make_rube_transport(failure_rate=1.0)
+        async with httpx.AsyncClient(transport=transport) as http_client:
+            return await http_client.get("https://rube.test/recipe-hub/discover")
+
+    assert asyncio.run(fetch()).status_code == 503
@@ -0,0 +1,136 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from benchmarks.fakes import FAKE_PLAN, FakeGeminiClient
+from main import app
+from plan_stream import IncrementalPlanParser, parse_plan_text, validate_plan
+from rate_limit import RateLimiter, RateLimitPolicy
+
+client = TestClient(app)
+
+PLAN_TEXT = "```json\n" + json.dumps(FAKE_PLAN, indent=2) + "\n```"
+
+
+def test_sections_are_emitted_as_soon_as_complete():
+    parser = IncrementalPlanParser()
+    seen = []
+    for start in range(0, len(PLAN_TEXT), 5):
+        chunk = PLAN_TEXT[start : start + 5]
+        seen.extend((start, name) for name, _ in parser.feed(chunk))
+
+    assert [name for _, name in seen] == ["workout_plan", "diet_plan", "rationale"]
+    # Each section is available before the next one starts arriving.
+    assert seen[0][0] < PLAN_TEXT.index('"diet_plan"')
+    assert seen[1][0] < PLAN_TEXT.index('"rationale"')
+    assert parser.sections == FAKE_PLAN
+
+    result = parser.finish()
+    assert result.valid
+    assert not result.repaired
+    assert result.plan == FAKE_PLAN
+
+
+def test_truncated_output_is_repaired():
+    text = PLAN_TEXT[: PLAN_TEXT.index('"rationale"') + len('"rationale": "Bal')]
+    result = parse_plan_text(text)
+    assert result.repaired
+    assert result.plan["diet_plan"] == FAKE_PLAN["diet_plan"]
+    assert result.plan["rationale"] == "Bal"
+    assert result.errors == []
+
+
+def test_truncated_mid_key_cuts_back_to_last_complete_value():
+    text = '{"workout_plan": [{"day": "Mon"}, {"day": "Tue"}], "diet_'
+    result = parse_plan_text(text)
+    assert result.plan == {"workout_plan": [{"day": "Mon"}, {"day": "Tue"}]}
+    assert "Missing `diet_plan`." in result.errors
+
+
+def test_trailing_commas_and_prose_are_tolerated():
+    text = (
+        'Here is your plan:\n{"workout_plan": ["Run",], "diet_plan": {"kcal": 2000,},'
+        ' "rationale": "Steady progress",}\nGood luck!'
+    )
+    result = parse_plan_text(text)
+    assert result.valid
+    assert result.plan["workout_plan"] == ["Run"]
+
+
+@pytest.mark.parametrize(
+    "plan, error",
+    [
+        ({"workout_plan": [1], "diet_plan": [1]}, "Missing `rationale`."),
+        (
+            {"workout_plan": "run", "diet_plan": [1], "rationale": "x"},
+            "`workout_plan` must be array or object.",
+        ),
+        ({"workout_plan": [], "diet_plan": [1], "rationale": "x"}, "is empty"),
+    ],
+)
+def test_validate_plan_reports_schema_errors(plan, error):
+    assert any(error in message for message in validate_plan(plan))
+
+
+def test_no_json_returns_text_result():
+    result = parse_plan_text("Sorry, I cannot help with that.")
+    assert result.plan is None
+    assert not result.valid
+
+
+def test_plan_stream_route_emits_sections_then_complete(monkeypatch):
+    monkeypatch.setattr(main, "GEMINI_API_KEY", "fake-gemini-key")
+    monkeypatch.setattr(main, "client", FakeGeminiClient(stream_chunk_size=16))
+    monkeypatch.setattr(main, "RATE_LIMITER", None)
+    monkeypatch.setattr(main, "RATE_LIMITER_INITIALIZED", True)
+
+    payload = {
+        "age": 30,
+        "height_cm": 175,
+        "weight_kg": 70,
+        "body_type": "Mesomorph",
+        "goal": "Muscle Gain",
+    }
+    with client.stream("POST", "/api/v1/plans/ai/stream", json=payload) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        events = [json.loads(line) for line in response.iter_lines() if line]
+
+    assert [event["name"] for event in events[:-1]] == [
+        "workout_plan",
+        "diet_plan",
+        "rationale",
+    ]
+    complete = events[-1]
+    assert complete["event"] == "complete"
+    assert complete["plan_json"] == FAKE_PLAN
+    assert complete["plan_errors"] == []
+
+    response = client.post("/api/v1/plans/ai", json=payload)
+    assert response.json()["plan_json"] == FAKE_PLAN
+    assert response.json()["plan_format"] == "json"
+
+
+def test_plan_stream_route_keeps_rate_limit_headers(monkeypatch):
+    monkeypatch.setattr(main, "GEMINI_API_KEY", "fake-gemini-key")
+    monkeypatch.setattr(main, "client", FakeGeminiClient())
+    limiter = RateLimiter(
+        {"plans": RateLimitPolicy(capacity=5, refill_per_second=1)}, None
+    )
+    monkeypatch.setattr(main, "RATE_LIMITER", limiter)
+    monkeypatch.setattr(main, "RATE_LIMITER_INITIALIZED", True)
+
+    payload = {
+        "age": 30,
+        "height_cm": 175,
+        "weight_kg": 70,
+        "body_type": "Mesomorph",
+        "goal": "Muscle Gain",
+    }
+    with client.stream("POST", "/api/v1/plans/ai/stream", json=payload) as response:
+        assert response.status_code == 200
+        assert response.headers["X-RateLimit-Limit"] == "5"
+        assert response.headers["X-RateLimit-Remaining"] == "4"
+        assert "content-length" not in response.headers
@@ -0,0 +1,170 @@
+import pytest
+from fastapi import Request
+from fastapi.testclient import TestClient
+
+import main
+from main import app
+from rate_limit import (
+    InMemoryRateLimitBackend,
+    RateLimiter,
+    RateLimitPolicy,
+    RemoteRateLimitBackend,
+    client_identity,
+    client_ip,
+    create_rate_limiter_from_env,
+    parse_rate_limit_policy,
+)
+
+client = TestClient(app)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_limiter(clock, gemini_capacity=100.0, compact_interval=60.0):
+    return RateLimiter(
+        {
+            "chat": RateLimitPolicy(capacity=2, refill_per_second=1.0),
+            "plans": RateLimitPolicy(capacity=5, refill_per_second=1.0, cost=4),
+        },
+        RateLimitPolicy(capacity=gemini_capacity, refill_per_second=1.0),
+        compact_interval=compact_interval,
+        clock=clock,
+    )
+
+
+def test_bucket_refills_over_time():
+    clock = FakeClock()
+    limiter = make_limiter(clock)
+    assert limiter.check("chat", "alice")[1].allowed
+    assert limiter.check("chat", "alice")[1].allowed
+    user, limiting = limiter.check("chat", "alice")
+    assert not limiting.allowed
+    assert limiting.retry_after == 1.0
+    assert limiter.check("chat", "bob")[1].allowed
+
+    clock.now = 1.0
+    assert limiter.check("chat", "alice")[1].allowed
+
+
+def test_global_budget_charges_route_cost_all_or_nothing():
+    clock = FakeClock()
+    limiter = make_limiter(clock, gemini_capacity=6)
+    assert limiter.check("plans", "alice")[1].allowed
+
+    user, limiting = limiter.check("plans", "bob")
+    assert not limiting.allowed
+    assert limiting is not user
+    # Bob's own bucket was not charged for the rejected request.
+    assert user.remaining == 5
+    assert limiter.check("chat", "bob")[1].allowed
+
+
+def test_idle_buckets_are_compacted():
+    clock = FakeClock()
+    backend = InMemoryRateLimitBackend()
+    limiter = make_limiter(clock, compact_interval=10)
+    limiter.backend = backend
+    limiter.check("chat", "alice")
+    clock.now = 0.5
+    limiter.check("chat", "bob")
+    assert len(backend) == 3
+
+    clock.now = 1.2
+    assert backend.compact(clock.now) == 1
+    clock.now = 10
+    limiter.check("chat", "carol")
+    assert len(backend) == 2
+
+
+def test_remote_backend_lets_requests_through_when_owner_fails():
+    def failing_call(name, *args):
+        raise RuntimeError(f"Hot state service '{name}' failed")
+
+    limiter = make_limiter(FakeClock())
+    limiter.backend = RemoteRateLimitBackend(failing_call)
+    assert limiter.check("chat", "alice")[1].allowed
+
+
+def test_parse_rate_limit_policy(monkeypatch):
+    monkeypatch.setenv("FITOLA_RATE_LIMIT_TEST", "30/60")
+    policy = parse_rate_limit_policy("FITOLA_RATE_LIMIT_TEST", "1/1", cost=2)
+    assert policy == RateLimitPolicy(capacity=30, refill_per_second=0.5, cost=2)
+
+    monkeypatch.setenv("FITOLA_RATE_LIMIT_TEST", "thirty")
+    try:
+        parse_rate_limit_policy("FITOLA_RATE_LIMIT_TEST", "1/1")
+    except ValueError as exc:
+        assert "FITOLA_RATE_LIMIT_TEST" in str(exc)
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_chat_route_returns_429_with_headers(monkeypatch):
+    limiter = RateLimiter(
+        {"chat": RateLimitPolicy(capacity=1, refill_per_second=0.1)}, None
+    )
+    monkeypatch.setattr(main, "RATE_LIMITER", limiter)
+    monkeypatch.setattr(main, "RATE_LIMITER_INITIALIZED", True)
+    headers = {"Authorization": "Bearer chat-route-token"}
+
+    first = client.post("/api/v1/chat", json={"message": "hi"}, headers=headers)
+    assert first.status_code != 429
+
+    second = client.post("/api/v1/chat", json={"message": "hi"}, headers=headers)
+    assert second.status_code == 429
+    assert second.headers["X-RateLimit-Limit"] == "1"
+    assert second.headers["X-RateLimit-Remaining"] == "0"
+    assert second.headers["Retry-After"] == "10"
+
+    # Unverified tokens do not buy a fresh bucket.
+    other = client.post(
+        "/api/v1/chat", json={"message": "hi"}, headers={"Authorization": "Bearer x"}
+    )
+    assert other.status_code == 429
+
+
+def make_request(headers=None, user_id=None, host="203.0.113.7"):
+    scope = {
+        "type": "http",
+        "headers": [
+            (k.lower().encode(), v.encode()) for k, v in (headers or {}).items()
+        ],
+        "client": (host, 4000),
+    }
+    built = Request(scope)
+    if user_id:
+        built.state.user_id = user_id
+    return built
+
+
+def test_client_identity_ignores_unverified_tokens():
+    assert client_identity(make_request()) == "ip:203.0.113.7"
+    assert (
+        client_identity(make_request({"Authorization": "Bearer random"}))
+        == "ip:203.0.113.7"
+    )
+    assert client_identity(make_request(user_id="u1")) == "user:u1"
+
+
+def test_forwarded_for_is_only_read_from_trusted_proxies(monkeypatch):
+    forwarded = {"X-Forwarded-For": "198.51.100.1, 192.0.2.9, 10.0.0.2"}
+    monkeypatch.delenv("FITOLA_TRUSTED_PROXIES", raising=False)
+    assert client_ip(make_request(forwarded, host="10.0.0.1")) == "10.0.0.1"
+
+    monkeypatch.setenv("FITOLA_TRUSTED_PROXIES", "10.0.0.0/8")
+    assert client_ip(make_request(forwarded, host="10.0.0.1")) == "192.0.2.9"
+    # A client connecting directly cannot pick its own bucket.
+    assert client_ip(make_request(forwarded)) == "203.0.113.7"
+
+    monkeypatch.setenv("FITOLA_TRUSTED_PROXIES", "*")
+    assert client_ip(make_request(forwarded)) == "10.0.0.2"
+
+    monkeypatch.setenv("FITOLA_TRUSTED_PROXIES", "not-an-ip")
+    with pytest.raises(ValueError):
+        create_rate_limiter_from_env()
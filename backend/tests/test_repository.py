@@ -0,0 +1,260 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from repository import (
+    ProfileCache,
+    RepositoryFullError,
+    SQLiteBackend,
+    UserRepository,
+)
+
+client = TestClient(app)
+
+
+def make_repository(**kwargs) -> UserRepository:
+    kwargs.setdefault("flush_interval", 60)
+    return UserRepository(SQLiteBackend(":memory:"), **kwargs)
+
+
+def test_profile_updates_coalesce_into_one_row():
+    repository = make_repository()
+    repository.save_profile({"id": "u1", "email": "a@example.com", "name": "A"})
+    repository.save_profile({"id": "u1", "weight": 70.0, "goals": ["Strength"]})
+    repository.save_profile({"id": "u1", "weight": 71.5, "city": None})
+
+    # Queued writes are visible before they reach the database.
+    assert repository.backend.fetch_profile("u1") is None
+    assert repository.get_profile("u1")["weight"] == 71.5
+
+    repository.flush()
+    stored = repository.backend.fetch_profile("u1")
+    assert stored["name"] == "A"
+    assert stored["weight"] == 71.5
+    assert stored["goals"] == ["Strength"]
+    assert repository.stats["profile_rows_written"] == 1
+    assert repository.stats["profile_updates_coalesced"] == 2
+    repository.close()
+
+
+def test_partial_update_keeps_stored_columns():
+    repository = make_repository()
+    repository.save_profile({"id": "u1", "email": "a@example.com", "name": "A"})
+    repository.flush()
+    repository.save_profile({"id": "u1", "city": "Pune"})
+    repository.flush()
+    stored = repository.backend.fetch_profile("u1")
+    assert stored["email"] == "a@example.com"
+    assert stored["city"] == "Pune"
+    repository.close()
+
+
+def test_partial_update_never_creates_a_row():
+    repository = make_repository()
+    repository.save_profile({"id": "ghost", "weight": 60.0})
+    repository.flush()
+    assert repository.backend.fetch_profile("ghost") is None
+    repository.close()
+
+
+def test_registering_an_existing_id_changes_nothing():
+    repository = make_repository()
+    repository.save_profile(
+        {"id": "u1", "email": "a@example.com", "name": "A", "created_at": "t1"}
+    )
+    repository.flush()
+    repository.save_profile({"id": "u1", "weight": 60.0})
+    repository.flush()
+    assert repository.stats["profile_rows_updated"] == 1
+
+    repository.save_profile(
+        {"id": "u1", "email": "b@example.com", "name": "B", "created_at": "t2"}
+    )
+    repository.flush()
+    stored = repository.backend.fetch_profile("u1")
+    assert (stored["email"], stored["name"], stored["created_at"]) == (
+        "a@example.com",
+        "A",
+        "t1",
+    )
+    assert stored["weight"] == 60.0
+    repository.close()
+
+
+def message(message_id: str, text) -> dict:
+    return {
+        "id": message_id,
+        "sender_id": "u1",
+        "receiver_id": "u2",
+        "message": text,
+        "type": "text",
+        "timestamp": f"2026-02-01T12:00:0{message_id[-1]}Z",
+        "is_read": False,
+    }
+
+
+def test_bad_row_is_isolated_then_dead_lettered():
+    repository = make_repository(max_attempts=2)
+    repository.add_message(message("m1", "ok"))
+    repository.add_message(message("m2", None))  # violates NOT NULL
+    repository.add_message(message("m3", "ok"))
+    repository.save_profile({"id": "u1", "email": "a@example.com", "name": "A"})
+
+    with pytest.raises(RuntimeError):
+        repository.flush()
+    stored = repository.backend.fetch_conversation("u1", "u2", 10)
+    assert [row["id"] for row in stored] == ["m1", "m3"]
+    assert repository.backend.fetch_profile("u1") is not None
+    assert repository.stats["rows_retried"] == 1
+
+    with pytest.raises(RuntimeError):
+        repository.flush()
+    assert [row["id"] for _, row, _ in repository.dead_letters] == ["m2"]
+    repository.flush()  # Nothing left to retry.
+    assert repository.stats["rows_dead_lettered"] == 1
+    repository.close()
+
+
+def test_queue_is_capped():
+    repository = make_repository(max_pending=2)
+    repository.save_profile({"id": "u1", "email": "a@example.com", "name": "A"})
+    repository.add_message(message("m1", "hi"))
+    # Coalescing into an already queued profile does not grow the queue.
+    repository.save_profile({"id": "u1", "weight": 70.0})
+    with pytest.raises(RepositoryFullError):
+        repository.add_message(message("m2", "hi"))
+    repository.flush()
+    repository.add_message(message("m2", "hi"))
+    repository.close()
+
+
+def test_profile_reads_are_cached_and_invalidated_on_flush():
+    repository = make_repository()
+    repository.save_profile({"id": "u1", "email": "a@example.com", "name": "A"})
+    repository.flush()
+
+    repository.get_profile("u1")
+    repository.get_profile("u1")
+    assert repository.stats["cache_misses"] == 1
+    assert repository.stats["cache_hits"] == 1
+
+    repository.save_profile({"id": "u1", "name": "B"})
+    assert repository.get_profile("u1")["name"] == "B"
+    repository.flush()
+    assert repository.get_profile("u1")["name"] == "B"
+    assert repository.stats["cache_misses"] == 2
+    repository.close()
+
+
+def test_read_racing_flushes_does_not_apply_an_older_overlay():
+    repository = make_repository(cache_size=0)
+    repository.save_profile({"id": "u1", "email": "a@example.com", "name": "A"})
+    repository.flush()
+    repository.save_profile({"id": "u1", "weight": 70.0})
+    fetch_profile = repository.backend.fetch_profile
+    raced = []
+
+    def racing_fetch(user_id):
+        if not raced:
+            # The queued update and a newer one land before the read runs.
+            raced.append(True)
+            repository.flush()
+            repository.save_profile({"id": "u1", "weight": 80.0})
+            repository.flush()
+        return fetch_profile(user_id)
+
+    repository.backend.fetch_profile = racing_fetch
+    assert repository.get_profile("u1")["weight"] == 80.0
+    repository.close()
+
+
+def test_cache_skips_stale_put_after_invalidation():
+    cache = ProfileCache(max_entries=2)
+    generation = cache.generation
+    cache.invalidate("u1")
+    cache.put("u1", {"id": "u1"}, generation)
+    assert cache.get("u1") is None
+
+    for key in ("a", "b", "c"):
+        cache.put(key, {"id": key}, cache.generation)
+    assert len(cache) == 2
+    assert cache.get("a") is None
+
+
+def test_messages_are_batched_and_ordered():
+    repository = make_repository(batch_size=1000)
+    for index in range(120):
+        sender, receiver = ("u1", "u2") if index % 2 else ("u2", "u1")
+        repository.add_message(
+            {
+                "id": f"msg-{index}",
+                "sender_id": sender,
+                "receiver_id": receiver,
+                "message": f"hello {index}",
+                "type": "text",
+                "timestamp": f"2026-02-01T12:{index // 60:02d}:{index % 60:02d}Z",
+                "is_read": False,
+            }
+        )
+    assert len(repository.get_conversation("u1", "u2", limit=10)) == 10
+
+    repository.flush()
+    assert repository.stats["flushes"] == 1
+    messages = repository.get_conversation("u2", "u1", limit=5)
+    assert [message["id"] for message in messages] == [
+        f"msg-{index}" for index in range(115, 120)
+    ]
+    assert messages[0]["is_read"] is False
+    repository.close()
+
+
+def test_background_flush_when_batch_is_full():
+    repository = make_repository(batch_size=2)
+    repository.save_profile({"id": "u1", "email": "a@example.com", "name": "A"})
+    repository.save_profile({"id": "u2", "email": "b@example.com", "name": "B"})
+    repository._flusher.join(timeout=0.5)
+    assert repository.backend.fetch_profile("u2") is not None
+    repository.close()
+
+
+def test_profile_endpoints_round_trip():
+    response = client.post(
+        "/api/v1/auth/register",
+        json={"id": "api-user", "email": "api@example.com", "name": "Api"},
+    )
+    assert response.status_code == 200
+    response = client.post(
+        "/api/v1/auth/register",
+        json={"id": "api-user", "email": "other@example.com", "name": "Other"},
+    )
+    assert response.status_code == 409
+
+    response = client.put(
+        "/api/v1/user/profile", json={"id": "api-user", "weight": 80.5}
+    )
+    assert response.status_code == 200
+
+    profile = client.get("/api/v1/user/profile/api-user").json()
+    assert profile["email"] == "api@example.com"
+    assert profile["weight"] == 80.5
+
+    assert client.get("/api/v1/user/profile/missing-user").status_code == 404
+
+    response = client.put("/api/v1/user/profile", json={"weight": 80.5})
+    assert response.status_code == 422
+    response = client.put(
+        "/api/v1/user/profile", json={"id": "missing-user", "weight": 80.5}
+    )
+    assert response.status_code == 404
+
+
+def test_chat_message_endpoints_round_trip():
+    sent = client.post(
+        "/api/v1/chat/message",
+        json={"sender_id": "chat-a", "receiver_id": "chat-b", "message": "Hi!"},
+    ).json()
+    assert uuid.UUID(sent["id"])
+    conversation = client.get("/api/v1/chat/conversation/chat-b/chat-a").json()
+    assert [message["id"] for message in conversation["messages"]] == [sent["id"]]
@@ -0,0 +1,203 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from main import app
+from rube_client import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryBudget,
+    RubeClient,
+    RubeClientConfig,
+    load_rube_client_config,
+)
+
+client = TestClient(app)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def scripted_transport(outcomes):
+    """Replay `outcomes` (status codes, or exceptions to raise) in order."""
+    outcomes = list(outcomes)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome, json={"status": outcome})
+
+    return httpx.MockTransport(handler)
+
+
+def make_client(outcomes, clock=None, **config):
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    rube = RubeClient(
+        RubeClientConfig(**config),
+        transport=scripted_transport(outcomes),
+        clock=clock or FakeClock(),
+        sleep=fake_sleep,
+        rng=lambda: 0.5,
+    )
+    return rube, sleeps
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_transient_failures_are_retried_with_jittered_backoff():
+    connect_error = httpx.ConnectError("refused")
+    rube, sleeps = make_client([connect_error, 503, 200], retry_backoff=0.1)
+    response = run(rube.get("https://rube.test/recipes"))
+
+    assert response.status_code == 200
+    assert sleeps == [0.1, 0.2]
+    metrics = rube.metrics()
+    assert metrics["retries"] == 2
+    host = metrics["hosts"]["rube.test"]
+    assert host["requests"] == 3
+    assert host["transport_errors"] == 1
+    assert host["responses"] == {"5xx": 1, "2xx": 1}
+
+
+def test_client_errors_are_not_retried():
+    rube, sleeps = make_client([404])
+    assert run(rube.get("https://rube.test/recipes")).status_code == 404
+    assert sleeps == []
+    assert rube.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_last_failure_is_returned_when_retries_run_out():
+    rube, _ = make_client([503, 503, 503], max_retries=2)
+    assert run(rube.get("https://rube.test/recipes")).status_code == 503
+
+    rube, _ = make_client([httpx.ReadTimeout("slow")], max_retries=0)
+    with pytest.raises(httpx.ReadTimeout):
+        run(rube.get("https://rube.test/recipes"))
+
+
+def test_retry_budget_limits_retries_to_a_share_of_traffic():
+    clock = FakeClock()
+    budget = RetryBudget(ratio=0.5, min_per_second=0, max_balance=2, clock=clock)
+    assert budget.try_withdraw()
+    assert budget.try_withdraw()
+    assert not budget.try_withdraw()
+    budget.record_request()
+    assert not budget.try_withdraw()
+    budget.record_request()
+    assert budget.try_withdraw()
+
+
+def test_exhausted_budget_stops_retry_storm():
+    clock = FakeClock()
+    rube, _ = make_client(
+        [503] * 20,
+        clock=clock,
+        max_retries=3,
+        retry_budget_ratio=0,
+        retry_budget_min_per_second=0,
+        breaker_failure_threshold=100,
+    )
+    rube.retry_budget._balance = 1
+    for _ in range(3):
+        run(rube.get("https://rube.test/recipes"))
+    metrics = rube.metrics()
+    assert metrics["retries"] == 1
+    assert metrics["retries_denied_by_budget"] == 3
+    assert metrics["hosts"]["rube.test"]["requests"] == 4
+
+
+def test_circuit_opens_then_half_open_probe_closes_it():
+    clock = FakeClock()
+    rube, _ = make_client(
+        [503, 503, 503, 200],
+        clock=clock,
+        max_retries=0,
+        breaker_failure_threshold=2,
+        breaker_reset_timeout=10,
+    )
+    run(rube.get("https://rube.test/recipes"))
+    run(rube.get("https://rube.test/recipes"))
+    assert rube.breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 4
+    with pytest.raises(CircuitOpenError) as excinfo:
+        run(rube.get("https://rube.test/recipes"))
+    assert excinfo.value.retry_after == 6
+
+    # The half-open probe fails and re-opens the circuit...
+    clock.now = 10
+    run(rube.get("https://rube.test/recipes"))
+    assert rube.breaker.state == CircuitBreaker.OPEN
+
+    # ...and a successful probe closes it.
+    clock.now = 20
+    assert run(rube.get("https://rube.test/recipes")).status_code == 200
+    assert rube.breaker.state == CircuitBreaker.CLOSED
+    assert rube.metrics()["circuit_rejections"] == 1
+
+
+def test_half_open_allows_a_single_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=1, clock=clock)
+    assert breaker.before_request() is False
+    breaker.record_failure()
+    clock.now = 1
+    assert breaker.before_request() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    # A request started while closed must not free the probe slot.
+    breaker.abandon_request(probe=False)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.abandon_request(probe=True)
+    assert breaker.before_request() is True
+
+
+def test_config_from_environment(monkeypatch):
+    monkeypatch.setenv("RUBE_MCP_MAX_CONNECTIONS", "50")
+    monkeypatch.setenv("RUBE_MCP_HTTP2", "true")
+    config = load_rube_client_config(timeout=5)
+    assert config.max_connections == 50
+    assert config.http2 is True
+    assert config.timeout == 5
+
+    monkeypatch.setenv("RUBE_MCP_MAX_RETRIES", "-1")
+    with pytest.raises(ValueError):
+        load_rube_client_config(timeout=5)
+
+
+def test_recipe_route_fails_fast_when_circuit_is_open(monkeypatch):
+    clock = FakeClock()
+    rube, _ = make_client(
+        [503], clock=clock, max_retries=0, breaker_failure_threshold=1
+    )
+    monkeypatch.setattr(main, "RUBE_HTTP_CLIENT", rube)
+    monkeypatch.setattr(main, "RUBE_HTTP_TIMEOUT", 10.0)
+    monkeypatch.setattr(main, "RUBE_MCP_VALIDATED_BASE_URL", "https://rube.test")
+    monkeypatch.setenv("RUBE_MCP_JWT", "token")
+
+    first = client.get("/api/v1/rube/recipe-hub/discover")
+    assert first.status_code == 503
+    second = client.get("/api/v1/rube/recipe-hub/discover")
+    assert second.status_code == 503
+    assert second.json()["detail"] == "Rube MCP is temporarily unavailable."
+    assert second.headers["Retry-After"] == "30"
+
+    metrics = client.get("/api/v1/rube/metrics").json()
+    assert metrics["circuit_state"] == "open"
+    assert metrics["hosts"]["rube.test"]["requests"] == 1